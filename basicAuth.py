@@ -8,24 +8,61 @@
 ###########################################################################
 
 from functools import wraps
-from flask import request, Response, jsonify, json, session
-import models, views, logs
+from flask import request, Response, jsonify, json, session, g
+from collections import namedtuple
+import hmac, hashlib, os
+import models, logs, cache, tokens, metrics
+
+CRED_CACHE_SIZE = 1024
+CRED_CACHE_TTL = 300    #seconds
+
+# Identity of the authenticated user, resolved once per request by
+# login_required and kept on flask.g.principal
+Principal = namedtuple('Principal', 'userid username role')
+
+# Recently verified credentials, keyed on a keyed digest of
+# username+password so plaintext passwords are never kept in memory.
+# The key is per process and never leaves it.
+_cred_key = os.urandom(32)
+verified_creds = cache.LRUCache(maxsize=CRED_CACHE_SIZE, ttl=CRED_CACHE_TTL)
+
+def cred_digest(username, password):
+    msg = (u'%s\x00%s' % (username, password)).encode('utf-8')
+    return hmac.new(_cred_key, msg, hashlib.sha256).digest()
+
+def invalidate_user(username):
+    """Drop cached credentials of username, call when a user is created
+       or their password changes"""
+    verified_creds.invalidate_if(
+                        lambda key, principal: principal.username == username)
+
+def cred_cache_stats():
+    return verified_creds.stats()
+
+metrics.register_cache('credentials', cred_cache_stats)
 
 def auth_test_dbcheck_pass(username, password):
+    """Returns Principal of user if username/password match, else None"""
+    #check verified credentials cache before going to db/bcrypt
+    digest = cred_digest(username, password)
+    principal = verified_creds.get(digest)
+    if principal is not None:
+        return principal
+
     #check for username 
-    query_obj = models.User.query.filter_by(username=username).all()
-    user_index = None
-    for i in range(len(query_obj)):
-        if username in query_obj[i].username:
-            user_index = i
-    if user_index is None:
-        return False
+    user_obj = models.user_by_name(username).first()
+    if user_obj is None:
+        return None
 
     #check for encrypted password 
-    if not views.bcrypt.check_password_hash(
-                    query_obj[user_index].password, password):
-        return False
-    return True
+    with metrics.timed(metrics.BCRYPT_SECONDS, 'check'):
+        password_ok = models.bcrypt.check_password_hash(user_obj.password,
+                                                        password)
+    if not password_ok:
+        return None
+    principal = Principal(user_obj.userid, user_obj.username, user_obj.role)
+    verified_creds.set(digest, principal)
+    return principal
 
 def send_authenticate_req():
     response =jsonify(dict())
@@ -45,18 +82,39 @@ def login_required(f):
         if not auth:
             return send_authenticate_req()
 
-        # Auth header is in the format 'basic username:pwd role:admin'
-        username, password = tuple(auth.split()[1].split(':'))
+        # Signed token issued by POST /users, 'Bearer token'. Checking
+        # it needs no db or bcrypt access
+        token = tokens.get_bearer_token(auth)
+        if token is not None:
+            claims = tokens.load_token(token)
+            if claims is None:
+                logs.debug_( "Invalid or expired token")
+                return send_authenticate_req()
+            principal = Principal(claims['userid'], claims['username'],
+                                  claims['role'])
 
-        if not auth_test_dbcheck_pass(username, password):
-            #Maybe we need to set a flag to limit the no of times
-            # we should authenticate?
-            logs.debug_( "Invalid username or password")
-            return send_authenticate_req()
+        else:
+            # Auth header is in the format 'basic username:pwd role:admin'.
+            # Missing credentials or ':' is a failed login, not an error
+            parts = auth.split(None, 2)
+            if len(parts) < 2 or ':' not in parts[1]:
+                logs.debug_( "Malformed Authorization header")
+                return send_authenticate_req()
+            username, password = parts[1].split(':', 1)
+
+            principal = auth_test_dbcheck_pass(username, password)
+            if principal is None:
+                #Maybe we need to set a flag to limit the no of times
+                # we should authenticate?
+                logs.debug_( "Invalid username or password")
+                return send_authenticate_req()
+
+        # Resolved identity for role checks and views of this request
+        g.principal = principal
 
         #Create Flask session here after user is authenticated
         if 'username' not in session:
-            session['username'] = username
+            session['username'] = principal.username
 
         return f(*args, **kwargs)
 
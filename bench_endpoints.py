@@ -0,0 +1,481 @@
+###########################################################################
+#
+#   File Name           Date        Owner          Description
+#   ---------------   --------    ---------      ---------------------
+#   bench_endpoints.py 7/8/2018   pyflask   Load benchmark of the qzngn
+#                                              endpoints
+#
+#  Drives every route registered in views.py (except /metrics) with a
+#  weighted admin/quiz taker mix at one or more concurrency levels and
+#  reports throughput, p50/p95/p99 latency and db queries per request
+#  for each endpoint. Results are saved as json and can be compared with
+#  an earlier run.
+#
+#  By default the app runs in process (Flask test client) on a fresh
+#  sqlite db in a temp directory. With --url a running server is used
+#  instead, db queries per request are then only available from the
+#  server's /metrics (QZNGN_METRICS=1).
+#
+#  Usage: python bench_endpoints.py [--mix mixed|taker|admin]
+#             [--concurrency 1 4 16] [--requests 2000] [--seed 1]
+#             [--url http://127.0.0.1:5001] [--out bench_results.json]
+#             [--baseline old.json [--tolerance 0.2]]
+#
+###########################################################################
+
+import argparse, itertools, json, os, random, sys, tempfile, threading
+import time
+import platform
+
+ADMIN_AUTH = 'Basic Archana:mypwd role:admin'
+QZID = 1
+
+# Operations: (name, taker weight, admin weight, request builder).
+# Builders get (rng, state, transport) and return (method, url, body or
+# None, auth). Builders of deletes first create a fresh quiz or question
+# through transport; these requests are not timed.
+
+def _taker(state, rng):
+    return 'Bearer %s' % rng.choice(state['tokens'])
+
+def _question(state, rng):
+    return rng.choice(state['questions'])
+
+def _answer(question, rng):
+    return [dict(correct=rng.random() < 0.5)
+            for i in range(question['no_choices'])]
+
+_fixture_ids = itertools.count(1)
+
+def _quiz_body():
+    return dict(title='Bench quiz %i-%i' % (os.getpid(), next(_fixture_ids)),
+                difficulty_level='Simple', text='Bench quiz')
+
+def _question_body(rng):
+    return dict(ques_text='Bench new question %i-%i' % (os.getpid(),
+                                                        next(_fixture_ids)),
+                ans_text='Bench answer',
+                anschoices=[dict(answer='choice %i' % c,
+                                 correct=rng.random() < 0.4)
+                            for c in range(rng.randint(2, 5))])
+
+def _new_quiz(transport):
+    status, data, queries = transport.request('POST', '/admin/quizzes',
+                                              _quiz_body(), ADMIN_AUTH)
+    return json.loads(data)['quiz'][0]['qzid']
+
+def _new_question(transport, rng, qzid):
+    status, data, queries = transport.request('POST',
+                '/admin/quizzes/%i/questions' % qzid, _question_body(rng),
+                ADMIN_AUTH)
+    return json.loads(data)['question'][0]['qid']
+
+def user_quizzes(rng, state, transport):
+    return 'GET', '/user/quizzes', None, _taker(state, rng)
+
+def user_quiz(rng, state, transport):
+    return 'GET', '/user/quizzes/%i' % QZID, None, _taker(state, rng)
+
+def user_question(rng, state, transport):
+    return ('GET', '/user/quizzes/%i/questions/%i'
+            % (QZID, _question(state, rng)['qid']), None, _taker(state, rng))
+
+def user_answer(rng, state, transport):
+    question = _question(state, rng)
+    return ('POST', '/user/quizzes/%i/questions/%i' % (QZID, question['qid']),
+            dict(anschoices=_answer(question, rng)), _taker(state, rng))
+
+def user_answers(rng, state, transport):
+    questions = rng.sample(state['questions'],
+                           min(10, len(state['questions'])))
+    answers = [dict(qid=question['qid'], anschoices=_answer(question, rng))
+               for question in questions]
+    return ('POST', '/user/quizzes/%i/answers' % QZID, dict(answers=answers),
+            _taker(state, rng))
+
+def user_result(rng, state, transport):
+    return ('GET', '/user/quizzes/%i/result' % QZID, None,
+            _taker(state, rng))
+
+def user_leaderboard(rng, state, transport):
+    return ('GET', '/user/quizzes/%i/leaderboard' % QZID, None,
+            _taker(state, rng))
+
+def users_login(rng, state, transport):
+    username = rng.choice(state['takers'])
+    return ('POST', '/users', dict(username=username, password='bench',
+                                   role='user'), None)
+
+def admin_quizzes(rng, state, transport):
+    return 'GET', '/admin/quizzes', None, ADMIN_AUTH
+
+def admin_quiz(rng, state, transport):
+    return 'GET', '/admin/quizzes/%i' % QZID, None, ADMIN_AUTH
+
+def admin_quiz_patch(rng, state, transport):
+    return ('PATCH', '/admin/quizzes/%i' % QZID,
+            dict(text='Bench %i' % rng.randint(0, 999)), ADMIN_AUTH)
+
+def admin_questions(rng, state, transport):
+    after = _question(state, rng)['qid'] - 1
+    return ('GET', '/admin/quizzes/%i/questions?limit=50&after=%i'
+            % (QZID, after), None, ADMIN_AUTH)
+
+def admin_question(rng, state, transport):
+    return ('GET', '/admin/quizzes/%i/questions/%i'
+            % (QZID, _question(state, rng)['qid']), None, ADMIN_AUTH)
+
+def admin_question_patch(rng, state, transport):
+    question = _question(state, rng)
+    anschoices = [dict(answer='choice %i' % i, correct=choice['correct'])
+                  for i, choice in enumerate(_answer(question, rng))]
+    return ('PATCH', '/admin/quizzes/%i/questions/%i'
+            % (QZID, question['qid']),
+            dict(ques_text=question['ques_text'], ans_text='Bench answer',
+                 anschoices=anschoices), ADMIN_AUTH)
+
+def admin_tables(rng, state, transport):
+    return 'GET', '/admin/tables/quiz?per_page=50', None, ADMIN_AUTH
+
+def session_delete(rng, state, transport):
+    return 'DELETE', '/session', None, _taker(state, rng)
+
+def admin_quiz_post(rng, state, transport):
+    return 'POST', '/admin/quizzes', _quiz_body(), ADMIN_AUTH
+
+def admin_quiz_delete(rng, state, transport):
+    return ('DELETE', '/admin/quizzes/%i' % _new_quiz(transport), None,
+            ADMIN_AUTH)
+
+def admin_question_post(rng, state, transport):
+    return ('POST', '/admin/quizzes/%i/questions' % state['scratch_qzid'],
+            _question_body(rng), ADMIN_AUTH)
+
+def admin_question_delete(rng, state, transport):
+    qzid = state['scratch_qzid']
+    return ('DELETE', '/admin/quizzes/%i/questions/%i'
+            % (qzid, _new_question(transport, rng, qzid)), None, ADMIN_AUTH)
+
+def admin_import(rng, state, transport):
+    lines = [json.dumps(_question_body(rng)) for i in range(10)]
+    return ('POST', '/admin/quizzes/%i/questions/import'
+            % state['scratch_qzid'], '\n'.join(lines) + '\n', ADMIN_AUTH)
+
+def admin_export(rng, state, transport):
+    return ('GET', '/admin/export/%s?format=%s&qzid=%i'
+            % (rng.choice(('quizzes', 'questions', 'results')),
+               rng.choice(('ndjson', 'csv')), QZID), None, ADMIN_AUTH)
+
+OPERATIONS = [
+    ('GET /user/quizzes', 10, 0, user_quizzes),
+    ('GET /user/quizzes/<qzid>', 10, 0, user_quiz),
+    ('GET /user/quizzes/<qzid>/questions/<qid>', 30, 0, user_question),
+    ('POST /user/quizzes/<qzid>/questions/<qid>', 25, 0, user_answer),
+    ('POST /user/quizzes/<qzid>/answers', 5, 0, user_answers),
+    ('GET /user/quizzes/<qzid>/result', 8, 0, user_result),
+    ('GET /user/quizzes/<qzid>/leaderboard', 8, 0, user_leaderboard),
+    ('POST /users', 1, 0, users_login),
+    ('DELETE /session', 1, 0, session_delete),
+    ('GET /admin/quizzes', 0, 15, admin_quizzes),
+    ('GET /admin/quizzes/<qzid>', 0, 15, admin_quiz),
+    ('PATCH /admin/quizzes/<qzid>', 0, 5, admin_quiz_patch),
+    ('GET /admin/quizzes/<qzid>/questions', 0, 25, admin_questions),
+    ('GET /admin/quizzes/<qzid>/questions/<qid>', 0, 25, admin_question),
+    ('PATCH /admin/quizzes/<qzid>/questions/<qid>', 0, 10,
+     admin_question_patch),
+    ('GET /admin/tables/<table>', 0, 5, admin_tables),
+    ('POST /admin/quizzes', 0, 2, admin_quiz_post),
+    ('DELETE /admin/quizzes/<qzid>', 0, 2, admin_quiz_delete),
+    ('POST /admin/quizzes/<qzid>/questions', 0, 5, admin_question_post),
+    ('POST /admin/quizzes/<qzid>/questions/import', 0, 1, admin_import),
+    ('DELETE /admin/quizzes/<qzid>/questions/<qid>', 0, 5,
+     admin_question_delete),
+    ('GET /admin/export/<kind>', 0, 2, admin_export),
+    ]
+
+# Share of requests made by admins in each mix
+MIXES = {'taker': 0.0, 'admin': 1.0, 'mixed': 0.1}
+
+def mix_weights(mix):
+    admin_share = MIXES[mix]
+    taker_total = float(sum(op[1] for op in OPERATIONS))
+    admin_total = float(sum(op[2] for op in OPERATIONS))
+    weights = []
+    for name, taker, admin, builder in OPERATIONS:
+        weight = ((1 - admin_share) * taker / taker_total +
+                  admin_share * admin / admin_total)
+        if weight:
+            weights.append((name, weight, builder))
+    return weights
+
+def pick(rng, weights):
+    point = rng.random() * sum(weight for name, weight, builder in weights)
+    for name, weight, builder in weights:
+        point -= weight
+        if point <= 0:
+            break
+    return name, builder
+
+def encode(body):
+    """(content type, data) of a request body, strings are sent as NDJSON"""
+    if body is None:
+        return 'application/json', None
+    if isinstance(body, basestring):
+        return 'application/x-ndjson', body
+    return 'application/json', json.dumps(body)
+
+class TestClientTransport(object):
+    """ Requests through the Flask test client, counting db queries """
+
+    def __init__(self, app, counter):
+        self.client = app.test_client()
+        self.counter = counter
+
+    def request(self, method, url, body, auth):
+        content_type, data = encode(body)
+        headers = {'Content-Type': content_type}
+        if auth:
+            headers['Authorization'] = auth
+        self.counter.queries = 0
+        response = self.client.open(url, method=method, headers=headers,
+                                    data=data)
+        return response.status_code, response.data, self.counter.queries
+
+class HttpTransport(object):
+    """ Requests to a running server, queries are not known per request """
+
+    def __init__(self, base_url):
+        import requests
+        self.session = requests.Session()
+        self.base_url = base_url.rstrip('/')
+
+    def request(self, method, url, body, auth):
+        content_type, data = encode(body)
+        headers = {'Content-Type': content_type}
+        if auth:
+            headers['Authorization'] = auth
+        response = self.session.request(method, self.base_url + url,
+                                        headers=headers, data=data)
+        return response.status_code, response.content, None
+
+def setup(transport, nquestions, ntakers, seed):
+    """ Imports the bench questions into quiz QZID, creates the quiz
+        takers and the scratch quiz and returns the state the request
+        builders use
+    """
+    rng = random.Random(seed)
+    lines = []
+    for i in range(nquestions):
+        lines.append(json.dumps(dict(ques_text='Bench question %i' % i,
+                        ans_text='Bench answer %i' % i,
+                        anschoices=[dict(answer='choice %i' % c,
+                                         correct=rng.random() < 0.4)
+                                    for c in range(rng.randint(2, 5))])))
+    transport.request('POST', '/admin/quizzes/%i/questions/import' % QZID,
+                      '\n'.join(lines) + '\n', ADMIN_AUTH)
+
+    questions = []
+    after = 0
+    while after is not None:
+        status, data, queries = transport.request('GET',
+                '/admin/quizzes/%i/questions?limit=1000&after=%i'
+                % (QZID, after), None, ADMIN_AUTH)
+        page = json.loads(data)
+        questions.extend(dict(qid=q['qid'], ques_text=q['ques_text'],
+                              no_choices=len(q['anschoices']))
+                         for q in page['questions'])
+        after = page['next']
+
+    takers = ['bench%i' % i for i in range(ntakers)]
+    tokens = []
+    for username in takers:
+        status, data, queries = transport.request('POST', '/users',
+                dict(username=username, password='bench', role='user'), None)
+        tokens.append(json.loads(data)['token'])
+    # Questions are added to and deleted from a separate quiz, so quiz
+    # QZID stays the same during the run
+    return dict(questions=questions, takers=takers, tokens=tokens,
+                scratch_qzid=_new_quiz(transport))
+
+def percentile(values, pct):
+    """Nearest rank percentile of sorted values"""
+    if not values:
+        return None
+    rank = max(int(round(pct / 100.0 * len(values) + 0.5)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+def summarize(samples):
+    """ Stats of one endpoint's (seconds, status, queries) samples """
+    latencies = sorted(seconds * 1000 for seconds, status, queries
+                       in samples)
+    queries = [q for seconds, status, q in samples if q is not None]
+    statuses = {}
+    for seconds, status, q in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return dict(requests=len(samples),
+                errors=len([s for t, s, q in samples if s >= 500]),
+                statuses=statuses,
+                mean_ms=round(sum(latencies) / len(latencies), 3),
+                p50_ms=round(percentile(latencies, 50), 3),
+                p95_ms=round(percentile(latencies, 95), 3),
+                p99_ms=round(percentile(latencies, 99), 3),
+                queries_per_request=(round(float(sum(queries)) /
+                                           len(queries), 2)
+                                     if queries else None))
+
+def run_level(make_transport, state, weights, concurrency, nrequests, seed):
+    """ nrequests requests split over concurrency threads, each with its
+        own transport and seeded rng. Returns the run's results dict.
+    """
+    samples = {}
+    lock = threading.Lock()
+    go = threading.Event()
+
+    def worker(index, count):
+        rng = random.Random(seed * 1000 + index)
+        transport = make_transport()
+        local = []
+        go.wait()
+        for i in range(count):
+            name, builder = pick(rng, weights)
+            start = None
+            try:
+                method, url, body, auth = builder(rng, state, transport)
+                start = time.time()
+                status, data, queries = transport.request(method, url, body,
+                                                          auth)
+            except Exception:
+                status, queries = 599, None
+            start = start or time.time()
+            local.append((name, (time.time() - start, status, queries)))
+        with lock:
+            for name, sample in local:
+                samples.setdefault(name, []).append(sample)
+
+    threads = [threading.Thread(target=worker,
+                                args=(i, nrequests // concurrency +
+                                      (i < nrequests % concurrency)))
+               for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    start = time.time()
+    go.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+
+    total = sum(len(s) for s in samples.values())
+    return dict(concurrency=concurrency, requests=total,
+                seconds=round(elapsed, 3),
+                throughput_rps=round(total / elapsed, 1),
+                endpoints=dict((name, summarize(s))
+                               for name, s in samples.iteritems()))
+
+def print_run(run):
+    print '\nconcurrency %(concurrency)i: %(requests)i requests in ' \
+          '%(seconds).2fs, %(throughput_rps).1f req/s' % run
+    print '%-45s %6s %5s %9s %9s %9s %7s' % ('endpoint', 'n', 'err',
+                        'p50 ms', 'p95 ms', 'p99 ms', 'queries')
+    for name in sorted(run['endpoints']):
+        stats = run['endpoints'][name]
+        print '%-45s %6i %5i %9.2f %9.2f %9.2f %7s' % (name,
+                stats['requests'], stats['errors'], stats['p50_ms'],
+                stats['p95_ms'], stats['p99_ms'],
+                stats['queries_per_request'])
+
+def compare(results, baseline, tolerance):
+    """ Prints p95 changes against baseline results, returns the
+        regressions beyond tolerance
+    """
+    regressions = []
+    old_runs = dict((run['concurrency'], run) for run in baseline['runs'])
+    for run in results['runs']:
+        old = old_runs.get(run['concurrency'])
+        if old is None:
+            continue
+        for name, stats in sorted(run['endpoints'].iteritems()):
+            old_stats = old['endpoints'].get(name)
+            if not old_stats or not old_stats['p95_ms']:
+                continue
+            change = stats['p95_ms'] / old_stats['p95_ms'] - 1
+            if change > tolerance:
+                regressions.append((run['concurrency'], name, change))
+                print 'REGRESSION c=%i %s p95 %.2f -> %.2f ms (%+.0f%%)' % (
+                        run['concurrency'], name, old_stats['p95_ms'],
+                        stats['p95_ms'], change * 100)
+    return regressions
+
+def in_process():
+    """ Imports the app on a fresh sqlite db in a temp directory. Returns
+        a transport factory.
+    """
+    os.environ.setdefault('QZNGN_LOG_LEVEL', 'WARNING')
+    os.chdir(tempfile.mkdtemp(prefix='qzngn-bench-'))
+    import models, views
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    app = views.create_app()
+    with app.app_context():
+        models.db_init(reset=True)
+
+    counter = threading.local()
+    @event.listens_for(Engine, 'after_cursor_execute')
+    def count_query(*args):
+        counter.queries = getattr(counter, 'queries', 0) + 1
+
+    return lambda: TestClientTransport(app, counter)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='qzngn load benchmark')
+    parser.add_argument('--mix', choices=sorted(MIXES), default='mixed')
+    parser.add_argument('--concurrency', type=int, nargs='+',
+                        default=[1, 4, 16])
+    parser.add_argument('--requests', type=int, default=2000,
+                        help='requests per concurrency level')
+    parser.add_argument('--questions', type=int, default=200)
+    parser.add_argument('--takers', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--url', help='running server, e.g. '
+                        'http://127.0.0.1:5001 (default: in process)')
+    parser.add_argument('--out', default='bench_results.json')
+    parser.add_argument('--baseline', help='earlier results to compare')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed p95 increase over baseline')
+    args = parser.parse_args(argv)
+    out = os.path.abspath(args.out)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    if args.url:
+        make_transport = lambda: HttpTransport(args.url)
+    else:
+        make_transport = in_process()
+    state = setup(make_transport(), args.questions, args.takers, args.seed)
+    weights = mix_weights(args.mix)
+
+    results = dict(meta=dict(mix=args.mix, seed=args.seed,
+                             questions=len(state['questions']),
+                             takers=args.takers,
+                             requests_per_level=args.requests,
+                             target=args.url or 'in-process',
+                             python=platform.python_version(),
+                             started=time.strftime('%Y-%m-%dT%H:%M:%S')),
+                   runs=[])
+    for concurrency in args.concurrency:
+        run = run_level(make_transport, state, weights, concurrency,
+                        args.requests, args.seed)
+        results['runs'].append(run)
+        print_run(run)
+
+    with open(out, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print '\nResults saved to %s' % out
+
+    if baseline is not None and compare(results, baseline, args.tolerance):
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
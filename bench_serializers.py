@@ -0,0 +1,72 @@
+###########################################################################
+#
+#   File Name           Date        Owner          Description
+#   ---------------   --------    ---------      ---------------------
+#   bench_serializers.py 7/8/2018  pyflask  Micro-benchmark of response
+#                                              serialization for qzngn
+#
+#  Compares marshal + jsonify (flask-restful fields built per request)
+#  with the precompiled schemas in serializers.py for a quiz of
+#  NQUES questions with NCHOICES answer choices each.
+#  Usage: python bench_serializers.py [nques] [repeat]
+#
+###########################################################################
+
+import sys, timeit
+import models
+import views
+import serializers
+from flask import jsonify
+from flask.ext.restful import fields, marshal
+
+NQUES = 1000
+NCHOICES = 4
+
+def make_questions(nques):
+    """Transient Question rows with answer choices, no db needed"""
+    questions = []
+    for qid in range(1, nques+1):
+        question = models.Question("Question text %i?" % qid,
+                                   "Answer text %i" % qid, 1, 1)
+        question.qid = qid
+        question.anschoices = [models.Anschoice(1, qid, "%i. choice" % i,
+                                                i == 0)
+                               for i in range(NCHOICES)]
+        questions.append(question)
+    return questions
+
+def marshal_jsonify(questions):
+    ans_fields = {'ans_choice':fields.String,
+                  'correct':fields.Boolean
+                 }
+    resource_fields =  {'qid':fields.Integer,
+                       'ques_text':fields.String,
+                       'ans_text':fields.String,
+                       'qzid':fields.Integer,
+                       'anschoices':fields.Nested(ans_fields)
+                      }
+    return jsonify(questions=marshal(questions, resource_fields)).get_data()
+
+def compiled_schema(questions):
+    return serializers.json_response(
+                questions=serializers.QUESTION.dump_many(questions)).get_data()
+
+def bench(nques=NQUES, repeat=5):
+    questions = make_questions(nques)
+    results = {}
+    with views.create_app().test_request_context():
+        for name, fn in (('marshal+jsonify', marshal_jsonify),
+                         ('serializers', compiled_schema)):
+            best = min(timeit.repeat(lambda: fn(questions), number=1,
+                                     repeat=repeat))
+            results[name] = best
+            print '%-16s %4i questions: %8.2f ms  %8i bytes' \
+                  %(name, nques, best*1000, len(fn(questions)))
+    print 'speedup: %.1fx (json encoder: %s)' \
+          %(results['marshal+jsonify']/results['serializers'],
+            serializers.fastjson.__name__)
+    return results
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:]]
+    bench(*args)
@@ -0,0 +1,97 @@
+###########################################################################
+#
+#   File Name      Date          Owner              Description
+#   ---------      ----          ----               -----------
+#   cache.py      7/8/2018     pyflask    Bounded in-process caches
+#                                            for qzengine APIs
+#
+###########################################################################
+
+import threading, time
+from collections import OrderedDict
+import metrics
+
+class LRUCache(object):
+    """ Bounded, thread safe LRU cache with an optional time to live per
+        entry. Hit/miss/eviction counters are kept so the cache can be
+        sized from its stats.
+    """
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Return cached value for key or default, refreshing its LRU slot"""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, expires = entry
+            if expires is not None and expires < time.time():
+                self.misses += 1
+                return default
+            self._entries[key] = entry
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        """Add/replace key, evicting the least recently used entry if full"""
+        expires = None
+        if self.ttl is not None:
+            expires = time.time() + self.ttl
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (value, expires)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key):
+        """Drop key from the cache if present"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def invalidate_if(self, pred):
+        """Drop all entries for which pred(key, value) is true"""
+        with self._lock:
+            stale = [key for key, (value, expires) in self._entries.items()
+                     if pred(key, value)]
+            for key in stale:
+                del self._entries[key]
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Counters used to size the cache"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return dict(hits=self.hits, misses=self.misses,
+                        evictions=self.evictions,
+                        size=len(self._entries), maxsize=self.maxsize,
+                        hit_rate=(float(self.hits)/lookups if lookups else 0.0))
+
+# Serialized json bodies of the user facing quiz endpoints, keyed by
+# (route, qzid, qid, ...). Entries are dropped by the admin write paths
+# through invalidate(); the ttl bounds staleness of other worker processes
+# which do not see those invalidations.
+RESPONSE_CACHE_SIZE = 4096
+RESPONSE_CACHE_TTL = 30     #seconds
+
+responses = LRUCache(maxsize=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL)
+metrics.register_cache('responses', responses.stats)
+
+def invalidate(*prefix):
+    """Drop cached responses whose key starts with prefix, e.g.
+       invalidate('question', qzid) drops all questions of quiz qzid"""
+    n = len(prefix)
+    return responses.invalidate_if(lambda key, value: key[:n] == prefix)
@@ -0,0 +1,68 @@
+###########################################################################
+#
+#   File Name      Date        Owner           Description
+#   ---------    -------     ---------        ------------
+#   config.py    7/8/2018     pyflask  App and database engine settings
+#                                            for qzengine restful APIs
+#
+#  Environment:
+#    QZNGN_BIND               host:port the server listens on
+#                             (default 127.0.0.1:5001)
+#    QZNGN_METRICS            1 serves /metrics, unauthenticated, so only
+#                             enable it where the path is not public
+#                             (default 0)
+#    QZNGN_SECRET_KEY         signs sessions and tokens, must be the same
+#                             in every worker process
+#    QZNGN_DATABASE_URI       SQLAlchemy URI (default sqlite:///<cwd>/models.db)
+#    QZNGN_READ_DATABASE_URI  URI read by GET/HEAD requests, e.g. a replica
+#                             (default the app's database URI on a
+#                             query_only pool). Empty sends reads to the
+#                             primary, as does an in memory sqlite db
+#    QZNGN_DB_POOL_SIZE       connections kept open per process (default 5)
+#    QZNGN_DB_MAX_OVERFLOW    extra connections under load (default 10)
+#    QZNGN_DB_POOL_TIMEOUT    seconds to wait for a free connection
+#                             (default 30)
+#    QZNGN_DB_POOL_RECYCLE    seconds before a connection is reopened
+#                             (default 3600)
+#    QZNGN_SQLITE_<PRAGMA>    overrides a value of SQLITE_PRAGMAS, e.g.
+#                             QZNGN_SQLITE_MMAP_SIZE=0
+#
+###########################################################################
+
+import os
+
+BIND = os.environ.get('QZNGN_BIND', '127.0.0.1:5001')
+METRICS = os.environ.get('QZNGN_METRICS', '0') == '1'
+SECRET_KEY = os.environ.get('QZNGN_SECRET_KEY',
+                            'A0Zr98j/3yX R~XHH!jmN]LWX/,?RT')
+DATABASE_URI = os.environ.get('QZNGN_DATABASE_URI',
+                    'sqlite:///' + os.path.abspath(os.getcwd()) + '/models.db')
+READ_DATABASE_URI = os.environ.get('QZNGN_READ_DATABASE_URI')
+POOL_SIZE = int(os.environ.get('QZNGN_DB_POOL_SIZE', '5'))
+MAX_OVERFLOW = int(os.environ.get('QZNGN_DB_MAX_OVERFLOW', '10'))
+POOL_TIMEOUT = int(os.environ.get('QZNGN_DB_POOL_TIMEOUT', '30'))
+POOL_RECYCLE = int(os.environ.get('QZNGN_DB_POOL_RECYCLE', '3600'))
+
+# Run on every new sqlite connection, in this order. WAL lets readers
+# run while a writer commits; synchronous=NORMAL is durable across
+# process crashes in WAL mode and only syncs at checkpoints.
+SQLITE_PRAGMAS = [(name, os.environ.get('QZNGN_SQLITE_' + name.upper(),
+                                        default))
+                  for name, default in (
+                      ('journal_mode', 'WAL'),
+                      ('synchronous', 'NORMAL'),
+                      ('busy_timeout', '5000'),         # ms
+                      ('mmap_size', '268435456'),       # 256MB
+                      ('cache_size', '-65536'),         # 64MB
+                  )]
+
+def engine_config(app):
+    """Sets the flask-sqlalchemy engine settings of app"""
+    app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URI
+    # None reads from SQLALCHEMY_DATABASE_URI, see models.get_read_engine
+    app.config['READ_DATABASE_URI'] = READ_DATABASE_URI
+    app.config['SQLALCHEMY_POOL_SIZE'] = POOL_SIZE
+    app.config['SQLALCHEMY_MAX_OVERFLOW'] = MAX_OVERFLOW
+    app.config['SQLALCHEMY_POOL_TIMEOUT'] = POOL_TIMEOUT
+    app.config['SQLALCHEMY_POOL_RECYCLE'] = POOL_RECYCLE
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
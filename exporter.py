@@ -0,0 +1,148 @@
+###########################################################################
+#
+#   File Name      Date        Owner           Description
+#   ---------    -------     ---------        ------------
+#   exporter.py  7/8/2018     pyflask  Streaming export of quizzes,
+#                                        questions and results for
+#                                        qzengine restful APIs
+#
+#  Rows are read with yield_per (a server side cursor where the driver
+#  supports it) and rendered EXPORT_BATCH at a time as NDJSON or CSV, so
+#  memory use does not grow with the size of the export. Rows are ordered
+#  by their id and every row carries it, an interrupted export is resumed
+#  with after=<last id received>. The questions CSV has one row per answer
+#  choice, so it is resumed on (qid, ansid) of the last row received:
+#  after=<qid>&after_ansid=<ansid>.
+#
+###########################################################################
+
+import csv
+from io import BytesIO
+from sqlalchemy import or_
+from itertools import groupby
+from operator import attrgetter
+import models
+import serializers
+
+EXPORT_BATCH = 1000
+
+FORMATS = {'ndjson': 'application/x-ndjson',
+           'csv': 'text/csv'}
+
+def quiz_rows(userid, after=0, qzid=None):
+    """ Quizzes of admin userid with qzid > after """
+    query_obj = models.db.session.query(models.Quiz.qzid, models.Quiz.title,
+                        models.Quiz.difficulty_level, models.Quiz.text,
+                        models.Quiz.no_ques).\
+                    filter(models.Quiz.userid == userid,
+                           models.Quiz.qzid > after)
+    if qzid is not None:
+        query_obj = query_obj.filter(models.Quiz.qzid == qzid)
+    return query_obj.order_by(models.Quiz.qzid).yield_per(EXPORT_BATCH)
+
+def question_rows(userid, after=0, qzid=None, after_ansid=None):
+    """ (question, anschoice) rows of the quizzes of admin userid after
+        the cursor, ordered by qid then ansid. The cursor is qid > after,
+        or with after_ansid (qid, ansid) > (after, after_ansid) so that a
+        question cut off mid way is resumed at its next answer choice.
+    """
+    Question, Anschoice = models.Question, models.Anschoice
+    query_obj = models.db.session.query(Question.qid, Question.qzid,
+                        Question.ques_text, Question.ans_text,
+                        Anschoice.ansid, Anschoice.ans_choice,
+                        Anschoice.correct).\
+                    select_from(Question).\
+                    join(models.Quiz, models.Quiz.qzid == Question.qzid).\
+                    outerjoin(Anschoice, Anschoice.qid == Question.qid).\
+                    filter(models.Quiz.userid == userid)
+    if after_ansid is None:
+        query_obj = query_obj.filter(Question.qid > after)
+    else:
+        query_obj = query_obj.filter(Question.qid >= after,
+                                     or_(Question.qid > after,
+                                         Anschoice.ansid > after_ansid))
+    if qzid is not None:
+        query_obj = query_obj.filter(Question.qzid == qzid)
+    return query_obj.order_by(Question.qid, Anschoice.ansid).\
+                yield_per(EXPORT_BATCH)
+
+def result_rows(userid, after=0, qzid=None):
+    """ Attempts at the quizzes of admin userid with attemptid > after """
+    Attempt = models.Attempt
+    query_obj = models.db.session.query(Attempt.attemptid, Attempt.userid,
+                        models.User.username, Attempt.qzid, Attempt.attempt,
+                        Attempt.answered, Attempt.total, Attempt.score).\
+                    select_from(Attempt).\
+                    join(models.Quiz, models.Quiz.qzid == Attempt.qzid).\
+                    join(models.User, models.User.userid == Attempt.userid).\
+                    filter(models.Quiz.userid == userid,
+                           Attempt.attemptid > after)
+    if qzid is not None:
+        query_obj = query_obj.filter(Attempt.qzid == qzid)
+    return query_obj.order_by(Attempt.attemptid).yield_per(EXPORT_BATCH)
+
+QUESTION_FIELDS = serializers.QUESTION.only('qid', 'qzid', 'ques_text',
+                                            'ans_text')
+
+def nested_questions(rows):
+    """ Question dicts with their anschoices list, from question_rows """
+    for qid, group in groupby(rows, attrgetter('qid')):
+        group = list(group)
+        question = QUESTION_FIELDS.dump(group[0])
+        question['anschoices'] = [serializers.ANSCHOICE.dump(row)
+                                  for row in group if row.ansid is not None]
+        yield question
+
+# kind -> (rows function, csv schema, ndjson records of rows)
+EXPORTS = {
+    'quizzes': (quiz_rows, serializers.QUIZ,
+                serializers.QUIZ.dump_many),
+    'questions': (question_rows, serializers.QUESTION_CHOICE,
+                  nested_questions),
+    'results': (result_rows, serializers.RESULT,
+                serializers.RESULT.dump_many),
+    }
+
+def batches(iterable, size=EXPORT_BATCH):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def ndjson_chunks(records):
+    for batch in batches(records):
+        yield ''.join([serializers.dumps(record) + '\n' for record in batch])
+
+def csv_value(value):
+    return value.encode('utf-8') if isinstance(value, unicode) else value
+
+def csv_chunks(schema, rows):
+    buf = BytesIO()
+    writer = csv.writer(buf)
+    writer.writerow(schema.names)
+    for batch in batches(rows):
+        for record in schema.dump_many(batch):
+            writer.writerow([csv_value(record[name])
+                             for name in schema.names])
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue()
+
+def export(kind, fmt, userid, after=0, qzid=None, after_ansid=None):
+    """ Generator of the encoded chunks of an export. after_ansid is only
+        taken by the questions CSV, see question_rows
+    """
+    rows_fn, schema, records = EXPORTS[kind]
+    if after_ansid is None:
+        rows = rows_fn(userid, after, qzid)
+    else:
+        rows = rows_fn(userid, after, qzid, after_ansid)
+    if fmt == 'csv':
+        return csv_chunks(schema, rows)
+    return ndjson_chunks(records(rows))
@@ -0,0 +1,158 @@
+###########################################################################
+#
+#   File Name      Date        Owner           Description
+#   ---------    -------     ---------        ------------
+#   grading.py   7/8/2018     pyflask  Grading of quiz taker answers
+#                                            for qzengine restful APIs
+#
+###########################################################################
+
+import models
+
+def answer_key(qzid):
+    """ Returns dict qid -> (answer_mask, no_choices) of every question of
+        quiz qzid, from one query on the question table
+    """
+    query_obj = models.db.session.query(models.Question.qid,
+                                        models.Question.answer_mask,
+                                        models.Question.no_choices).\
+                    filter_by(qzid=qzid)
+    return dict((qid, (mask, no_choices))
+                for qid, mask, no_choices in query_obj)
+
+def submitted_key(anschoices):
+    """ (mask, no_choices) of positional submitted anschoices, each
+        {"correct": "True"/"False"}
+    """
+    return models.answer_key_of([choice["correct"] for choice in anschoices])
+
+def grade(key, anschoices):
+    """ True if the submitted anschoices mark exactly the correct choices
+        of a question with answer key (answer_mask, no_choices)
+    """
+    return submitted_key(anschoices) == tuple(key)
+
+def add_to_score(userid, delta):
+    """ Atomically adds delta to the overall score of user """
+    if delta:
+        models.User.query.filter_by(userid=userid).update(
+                    {models.User.qzscore: models.User.qzscore + delta},
+                    synchronize_session=False)
+
+def record_answer(userid, qzid, qid, correct):
+    """ Records the outcome of one answered question in the user's open
+        attempt at the quiz, a new attempt is started when there is none
+        or all its questions are answered. Answering a question again
+        replaces its outcome. Returns (attempt, score delta); raises
+        IntegrityError if the same answer is recorded concurrently.
+    """
+    attempt = models.latest_attempt(userid, qzid)
+    if attempt is None or attempt.answered >= attempt.total:
+        total = models.questions_by_quiz(qzid).order_by(None).count()
+        attempt = models.start_attempt(userid, qzid, total)
+
+    prev = models.AttemptAnswer.query.filter_by(attemptid=attempt.attemptid,
+                                                qid=qid).first()
+    if prev is None:
+        models.db.session.add(models.AttemptAnswer(attempt.attemptid, qzid,
+                                                   qid, correct))
+        models.db.session.flush()
+        delta = int(correct)
+        models.add_to_attempt(attempt.attemptid, answered=1, score=delta)
+    elif prev.correct != correct:
+        # Conditional update, a concurrent change of the same outcome
+        # leaves rowcount 0 and the score is not adjusted twice
+        changed = models.AttemptAnswer.query.filter_by(
+                        id=prev.id, correct=prev.correct).update(
+                        {models.AttemptAnswer.correct: correct},
+                        synchronize_session=False)
+        delta = (1 if correct else -1) if changed else 0
+        models.add_to_attempt(attempt.attemptid, score=delta)
+    else:
+        delta = 0
+    add_to_score(userid, delta)
+    return attempt, delta
+
+def record_attempt(userid, qzid, results, total):
+    """ Records a whole graded attempt, results being list of
+        {"qid":, "correct":}. Returns the new Attempt.
+    """
+    score = len([r for r in results if r['correct']])
+    attempt = models.start_attempt(userid, qzid, total, len(results), score)
+    if results:
+        models.db.session.execute(models.AttemptAnswer.__table__.insert(),
+                     [dict(attemptid=attempt.attemptid, qzid=qzid,
+                           qid=r['qid'], correct=r['correct'])
+                      for r in results])
+    add_to_score(userid, score)
+    return attempt
+
+def remove_question(qzid, qid):
+    """ Takes question qid out of the attempts at the quiz, in the
+        caller's transaction. Attempts that answered it lose that answer
+        (answered, total and, if correct, score drop by one), open
+        attempts that did not yet answer it need one answer less, and
+        user and best scores are lowered to match. Call leaderboard.drop
+        once committed.
+    """
+    db = models.db
+    attempt, user = models.Attempt.__table__, models.User.__table__
+    answer = models.AttemptAnswer.__table__
+    correct = db.and_(answer.c.qid == qid, answer.c.correct == True)
+
+    # User scores first, they are counted from the answers being removed
+    lost_by_user = db.select([db.func.count()]).\
+                select_from(answer.join(attempt, attempt.c.attemptid ==
+                                                 answer.c.attemptid)).\
+                where(correct).where(attempt.c.userid == user.c.userid)
+    losers = db.select([attempt.c.userid]).\
+                select_from(answer.join(attempt, attempt.c.attemptid ==
+                                                 answer.c.attemptid)).\
+                where(correct)
+    db.session.execute(user.update().where(user.c.userid.in_(losers)).
+                       values(qzscore=user.c.qzscore -
+                                      lost_by_user.as_scalar()))
+
+    # Set expressions all see the attempt row before the update
+    had = db.select([db.func.count()]).\
+                where(answer.c.attemptid == attempt.c.attemptid).\
+                where(answer.c.qid == qid).as_scalar()
+    lost = db.select([db.func.count()]).\
+                where(answer.c.attemptid == attempt.c.attemptid).\
+                where(correct).as_scalar()
+    db.session.execute(attempt.update().where(attempt.c.qzid == qzid).
+                       values(answered=attempt.c.answered - had,
+                              score=attempt.c.score - lost,
+                              total=db.case([(attempt.c.total >
+                                              attempt.c.answered - had,
+                                              attempt.c.total - 1)],
+                                            else_=attempt.c.total)))
+    models.AttemptAnswer.query.filter_by(qid=qid).delete()
+    refresh_bests(qzid)
+
+def refresh_bests(qzid):
+    """Recomputes the quizbest rows of the quiz from its attempts"""
+    db = models.db
+    best, attempt = models.QuizBest.__table__, models.Attempt.__table__
+    top = db.select([db.func.max(attempt.c.score)]).\
+                where(attempt.c.qzid == best.c.qzid).\
+                where(attempt.c.userid == best.c.userid).as_scalar()
+    db.session.execute(best.update().where(best.c.qzid == qzid).
+                       values(best_score=db.func.coalesce(top, 0)))
+
+def remove_quiz(qzid):
+    """ Deletes the attempts at the quiz with their answers and best
+        scores, and takes their points off the user scores, in the
+        caller's transaction. Call leaderboard.drop once committed.
+    """
+    db = models.db
+    attempt, user = models.Attempt.__table__, models.User.__table__
+    points = db.select([db.func.coalesce(db.func.sum(attempt.c.score), 0)]).\
+                where(attempt.c.qzid == qzid).\
+                where(attempt.c.userid == user.c.userid).as_scalar()
+    takers = db.select([attempt.c.userid]).where(attempt.c.qzid == qzid)
+    db.session.execute(user.update().where(user.c.userid.in_(takers)).
+                       values(qzscore=user.c.qzscore - points))
+    models.AttemptAnswer.query.filter_by(qzid=qzid).delete()
+    models.Attempt.query.filter_by(qzid=qzid).delete()
+    models.QuizBest.query.filter_by(qzid=qzid).delete()
@@ -0,0 +1,35 @@
+###########################################################################
+#
+#   File Name          Date      Owner         Description
+#   ---------        -------   ---------      ------------
+#   gunicorn_conf.py 7/8/2018   pyflask  Prefork server settings for
+#                                             qzengine restful APIs
+#
+#  gunicorn -c gunicorn_conf.py wsgi:app
+#  The app is loaded once in the master and forked into one worker per
+#  core. Requests are mostly db bound and every worker has its own pools,
+#  so more workers add connections (and sqlite write contention) rather
+#  than throughput. Per process state (db pools, log writer thread,
+#  metrics, caches) is set up again in each worker.
+#  Environment:
+#    QZNGN_BIND      address to listen on, see config.py
+#    QZNGN_WORKERS   worker processes (default one per core)
+#
+###########################################################################
+
+import multiprocessing, os
+import config
+
+bind = config.BIND
+workers = int(os.environ.get('QZNGN_WORKERS', multiprocessing.cpu_count()))
+preload_app = True
+
+def pre_fork(server, worker):
+    # Nothing opened by the master is shared with a worker
+    import wsgi, models
+    models.dispose_engines(wsgi.app)
+
+def post_fork(server, worker):
+    # The log writer thread of the master does not exist in the worker
+    import logs
+    logs.start()
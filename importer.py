@@ -0,0 +1,160 @@
+###########################################################################
+#
+#   File Name      Date        Owner           Description
+#   ---------    -------     ---------        ------------
+#   importer.py  7/8/2018     pyflask  Bulk import of quiz questions
+#                                            for qzengine restful APIs
+#
+#  Questions are read as NDJSON, one json object per line with the same
+#  fields as POST /admin/quizzes/<qzid>/questions. Lines are parsed and
+#  validated one at a time and inserted IMPORT_CHUNK at a time with
+#  executemany, one transaction per chunk, so memory use does not grow
+#  with the size of the import.
+#  Usage: python importer.py <qzid> <admin username> [file.ndjson|-]
+#
+###########################################################################
+
+import sys
+from sqlalchemy import select, bindparam
+import models
+import validators
+import serializers
+
+# Rows per executemany/transaction. Kept under sqlite's 999 bound
+# parameters as the ques_text IN (...) lookups bind one per row.
+IMPORT_CHUNK = 500
+MAX_ERRORS = 100
+
+_question_ids = None
+
+def question_ids():
+    """ (ques_text, qid) lookup of a chunk's texts, built once. The
+        expanding bind parameter is rendered per execution instead of
+        building and compiling one bind per row.
+    """
+    global _question_ids
+    if _question_ids is None:
+        _question_ids = select([models.Question.ques_text,
+                                models.Question.qid]).where(
+                            models.Question.ques_text.in_(
+                                bindparam('texts', expanding=True)))
+    return _question_ids
+
+class ImportResult(object):
+    """ Counts and per-line errors of an import """
+
+    def __init__(self):
+        self.imported = 0
+        self.skipped = 0
+        self.errors = []
+
+    def error(self, lineno, message):
+        self.skipped += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append(dict(line=lineno, error=message))
+
+    def to_dict(self):
+        return dict(imported=self.imported, skipped=self.skipped,
+                    errors=self.errors)
+
+def iter_rows(lines, schema, result):
+    """ Yields (lineno, validated row) of the NDJSON lines, invalid lines
+        are recorded in result and skipped
+    """
+    for lineno, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = schema.validate(serializers.fastjson.loads(line))
+        except ValueError:
+            result.error(lineno, 'Error: Line is not valid json')
+            continue
+        except validators.ValidationError as e:
+            result.error(lineno, e.args[0])
+            continue
+        yield lineno, row
+
+def insert_chunk(chunk, qzid, userid, result):
+    """ Inserts a chunk of (lineno, row) in one transaction. Rows whose
+        ques_text already exists are skipped.
+    """
+    session = models.db.session
+    texts = [row['ques_text'] for lineno, row in chunk]
+    existing = set(text for text, qid in
+                   session.execute(question_ids(), dict(texts=texts)))
+    questions = []
+    choices = {}
+    for lineno, row in chunk:
+        text = row['ques_text']
+        if text in existing:
+            result.error(lineno, 'Error: Question %s already exists' % text)
+            continue
+        existing.add(text)
+        corrects = [models.is_correct(choice['correct'])
+                    for choice in row['anschoices']]
+        answer_mask, no_choices = models.answer_key_of(corrects)
+        questions.append(dict(ques_text=text, ans_text=row['ans_text'],
+                              qzid=qzid, userid=userid,
+                              answer_mask=answer_mask,
+                              no_choices=no_choices))
+        choices[text] = [(choice['answer'], correct) for choice, correct in
+                         zip(row['anschoices'], corrects)]
+    if not questions:
+        return
+
+    session.execute(models.Question.__table__.insert(), questions)
+    # executemany does not return ids, read them back by unique ques_text
+    qids = session.execute(question_ids(), dict(texts=list(choices)))
+    rows = [dict(qzid=qzid, qid=qid, ans_choice=answer, correct=correct)
+            for text, qid in qids for answer, correct in choices[text]]
+    if rows:
+        session.execute(models.Anschoice.__table__.insert(), rows)
+    session.commit()
+    result.imported += len(questions)
+
+def import_questions(lines, qzid, userid, schema, chunk_size=IMPORT_CHUNK):
+    """ Imports NDJSON question lines into quiz qzid. no_ques and the quiz
+        version are updated once at the end. Returns ImportResult.
+    """
+    result = ImportResult()
+    chunk = []
+    try:
+        for item in iter_rows(lines, schema, result):
+            chunk.append(item)
+            if len(chunk) >= chunk_size:
+                insert_chunk(chunk, qzid, userid, result)
+                chunk = []
+        if chunk:
+            insert_chunk(chunk, qzid, userid, result)
+    finally:
+        # Recount so no_ques is right even if a chunk failed
+        models.db.session.rollback()
+        if result.imported:
+            count = models.db.session.query(
+                        models.db.func.count(models.Question.qid)).\
+                        filter(models.Question.qzid == qzid).as_scalar()
+            models.bump_quiz_version(qzid, no_ques=count)
+            models.db.session.commit()
+    return result
+
+def main(argv):
+    import views
+    if len(argv) < 3:
+        sys.exit('Usage: python importer.py <qzid> <admin username> '
+                 '[file.ndjson|-]')
+    qzid = int(argv[1])
+    user = models.user_by_name(argv[2]).first()
+    quiz = models.Quiz.query.filter_by(qzid=qzid).first()
+    if user is None or quiz is None or quiz.userid != user.userid:
+        sys.exit('Error: Quiz %i not found for user %s' % (qzid, argv[2]))
+    path = argv[3] if len(argv) > 3 else '-'
+    lines = sys.stdin if path == '-' else open(path)
+    result = import_questions(lines, qzid, user.userid,
+                              views.AdmnQuestionsAPI.post_args)
+    print serializers.dumps(result.to_dict())
+
+if __name__ == '__main__':
+    import views
+    with views.create_app().app_context():
+        main(sys.argv)
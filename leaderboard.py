@@ -0,0 +1,145 @@
+###########################################################################
+#
+#   File Name        Date        Owner           Description
+#   -----------    --------    ---------       ----------------
+#   leaderboard.py  7/8/2018    pyflask   Quiz leaderboards for qzngn APIs
+#
+#  Best score of each taker is kept in the quizbest table (top-N is read
+#  through its (qzid, best_score) index). Ranks come from an in-process
+#  Fenwick tree of takers per score for each quiz, so "my rank" is
+#  O(log max score) instead of sorting all takers. Trees are updated
+#  incrementally after each committed score change and rebuilt from the
+#  table after LEADERBOARD_TTL seconds, which bounds how stale ranks can
+#  be when other processes change scores.
+#
+###########################################################################
+
+import threading, time
+import models
+
+LEADERBOARD_TTL = 60
+TOP_LIMIT = 10
+
+class ScoreTree(object):
+    """ Fenwick (binary indexed) tree counting takers per score, grows as
+        higher scores are added
+    """
+
+    def __init__(self, counts=(), size=16):
+        counts = list(counts)
+        self.size = max([size] + [score + 1 for score, n in counts])
+        self.takers = 0
+        self._tree = [0] * (self.size + 1)
+        for score, n in counts:
+            self.add(score, n)
+        self.built = time.time()
+
+    def add(self, score, n=1):
+        """Adds n takers with score"""
+        score = max(score, 0)
+        if score >= self.size:
+            self._grow(score)
+        index = score + 1
+        while index <= self.size:
+            self._tree[index] += n
+            index += index & -index
+        self.takers += n
+
+    def count_upto(self, score):
+        """Number of takers with a score <= score"""
+        total = 0
+        index = min(max(score, -1), self.size - 1) + 1
+        while index > 0:
+            total += self._tree[index]
+            index -= index & -index
+        return total
+
+    def rank(self, score):
+        """1 + number of takers with a higher score"""
+        return self.takers - self.count_upto(score) + 1
+
+    def _grow(self, score):
+        counts = [(s, self.count_upto(s) - self.count_upto(s - 1))
+                  for s in range(self.size)]
+        size = self.size
+        while size <= score:
+            size *= 2
+        self.size = size
+        self.takers = 0
+        self._tree = [0] * (size + 1)
+        for s, n in counts:
+            if n:
+                self.add(s, n)
+
+_trees = {}
+_lock = threading.Lock()
+
+def tree_for(qzid):
+    """ Score tree of quiz, (re)built from quizbest if missing or older
+        than LEADERBOARD_TTL
+    """
+    with _lock:
+        tree = _trees.get(qzid)
+    if tree is None or tree.built + LEADERBOARD_TTL < time.time():
+        tree = ScoreTree(models.score_counts(qzid))
+        with _lock:
+            _trees[qzid] = tree
+    return tree
+
+def update_best(userid, qzid):
+    """ Refreshes the quizbest row of user from their attempts, in the
+        caller's transaction. Returns the change to apply() once
+        committed, None if the best score is unchanged.
+    """
+    best = models.best_score_of(userid, qzid) or 0
+    row = models.QuizBest.query.filter_by(qzid=qzid, userid=userid).first()
+    if row is None:
+        models.db.session.add(models.QuizBest(qzid, userid, best))
+        models.db.session.flush()
+        return (qzid, None, best)
+    if row.best_score == best:
+        return None
+    models.QuizBest.query.filter_by(id=row.id).update(
+                    {models.QuizBest.best_score: best},
+                    synchronize_session=False)
+    return (qzid, row.best_score, best)
+
+def apply(change):
+    """Applies a committed change from update_best() to the score tree"""
+    if change is None:
+        return
+    qzid, old, new = change
+    with _lock:
+        tree = _trees.get(qzid)
+        if tree is None:
+            return
+        if old is not None:
+            tree.add(old, -1)
+        tree.add(new)
+
+def drop(qzid):
+    with _lock:
+        _trees.pop(qzid, None)
+
+def clear():
+    with _lock:
+        _trees.clear()
+
+def leaderboard(qzid, userid, limit=TOP_LIMIT):
+    """ Returns dict with the top limit takers of quiz (competition
+        ranking, ties share a rank), the rank of userid and the number of
+        takers
+    """
+    top = []
+    for username, score in models.top_scores(qzid, limit):
+        if not top or score != top[-1]['score']:
+            rank = len(top) + 1
+        top.append(dict(rank=rank, username=username, score=score))
+
+    tree = tree_for(qzid)
+    me = None
+    row = models.QuizBest.query.filter_by(qzid=qzid, userid=userid).first()
+    if row is not None:
+        with _lock:
+            me = dict(rank=tree.rank(row.best_score), score=row.best_score)
+    return dict(qzid=qzid, takers=tree.takers, top=top, me=me)
@@ -2,17 +2,119 @@
 #
 #   File Name    Date       Owner                Description
 #   ---------   -------    ---------           -----------------------
-#   logs.py    7/8/2018  pyflask   Logging module for qzengine 
+#   logs.py    7/8/2018  pyflask   Logging module for qzengine
+#
+#  Records are put on a bounded queue and written by a background thread,
+#  so a request never waits on the log stream. Messages take lazy
+#  %-style args and are only formatted if their level is enabled.
+#  Environment:
+#    QZNGN_LOG_LEVEL   DEBUG/INFO/WARNING/ERROR (default INFO)
+#    QZNGN_LOG_SAMPLE  fraction of requests whose debug output is
+#                      logged (default 1.0)
 #
 ###########################################################################
 
-import logging
+import logging, os, random, threading, atexit
+from Queue import Queue, Full
+from flask import g, has_request_context
+
+LOG_LEVEL = os.environ.get('QZNGN_LOG_LEVEL', 'INFO').upper()
+LOG_SAMPLE = float(os.environ.get('QZNGN_LOG_SAMPLE', '1.0'))
+LOG_QUEUE_SIZE = 10000
+LOG_FORMAT = '%(levelname)s:%(message)s'
+
+class QueueHandler(logging.Handler):
+    """ Hands records to the writer thread. When the queue is full the
+        record is dropped and counted instead of blocking the caller.
+    """
+
+    def __init__(self, queue):
+        logging.Handler.__init__(self)
+        self.queue = queue
+        self.dropped = 0
+
+    def emit(self, record):
+        try:
+            # Merge args now, they can change once the request is over
+            record.msg = record.getMessage()
+            record.args = None
+            if record.exc_info:
+                record.exc_text = logging.Formatter().formatException(
+                                                        record.exc_info)
+                record.exc_info = None
+            self.queue.put_nowait(record)
+        except Full:
+            self.dropped += 1
+        except Exception:
+            self.handleError(record)
+
+def _writer(queue, handler):
+    """Writes queued records until the None sentinel"""
+    while True:
+        record = queue.get()
+        if record is None:
+            break
+        handler.handle(record)
+
+_root = logging.getLogger()
+_queue = None
+_thread = None
+_pid = None
+
+def start(level=LOG_LEVEL, stream=None):
+    """ Installs the queue handler on the root logger and starts the
+        writer thread. Called again in a forked child, whose copy of the
+        parent's thread is not running.
+    """
+    global _queue, _thread, _pid
+    if _pid == os.getpid() and _thread is not None and _thread.is_alive():
+        return
+    target = logging.StreamHandler(stream)
+    target.setFormatter(logging.Formatter(LOG_FORMAT))
+    _queue = Queue(LOG_QUEUE_SIZE)
+    _thread = threading.Thread(target=_writer, args=(_queue, target),
+                               name='logs-writer')
+    _thread.daemon = True
+    _thread.start()
+    _pid = os.getpid()
+    _root.handlers = [QueueHandler(_queue)]
+    _root.setLevel(level)
+
+def stop(timeout=5):
+    """Flushes queued records and stops the writer thread"""
+    global _thread
+    if _thread is not None and _pid == os.getpid() and _thread.is_alive():
+        _queue.put(None)
+        _thread.join(timeout)
+    _thread = None
+
+def sampled():
+    """ True if debug output of the current request is logged, decided
+        once per request
+    """
+    if LOG_SAMPLE >= 1 or not has_request_context():
+        return True
+    if not hasattr(g, 'log_sampled'):
+        g.log_sampled = random.random() < LOG_SAMPLE
+    return g.log_sampled
+
+def info_(msg, *args):
+    if _root.isEnabledFor(logging.INFO):
+        _root.info(msg, *args)
 
-logging.basicConfig(format='%(levelname)s:%(message)s', level=logging.DEBUG)
+def warning_(msg, *args):
+    if _root.isEnabledFor(logging.WARNING):
+        _root.warning(msg, *args)
 
-def info_(prntstr):
-    logging.info(prntstr)
+def debug_enabled():
+    """ True if debug output of the current request is logged. Guard
+        debug_ calls whose args cost something to build (e.g. request.json)
+    """
+    return _root.isEnabledFor(logging.DEBUG) and sampled()
 
-def debug_(prntstr):
-    logging.debug(prntstr)
+def debug_(msg, *args):
+    if debug_enabled():
+        _root.debug(msg, *args)
 
+start()
+atexit.register(stop)
@@ -0,0 +1,186 @@
+###########################################################################
+#
+#   File Name      Date        Owner           Description
+#   ---------    -------     ---------        ------------
+#   metrics.py   7/8/2018     pyflask  Request, db and bcrypt metrics
+#                                            for qzengine restful APIs
+#
+#  Histograms are kept in process and rendered in the Prometheus text
+#  format only when /metrics is scraped. Recording an observation is a
+#  bisect and a few additions under a lock.
+#  Request metrics are labelled with the resource class and method,
+#  e.g. endpoint="AdmnQuestionsAPI.get".
+#  Caches registered with register_cache are published as counters and
+#  gauges labelled with the cache name, e.g. cache="responses".
+#  The endpoint has no authentication (scrapers cannot log in), so
+#  create_app only installs it with QZNGN_METRICS=1, see config.py.
+#
+###########################################################################
+
+import threading, time
+from bisect import bisect_left
+from contextlib import contextmanager
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5,
+                   5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+
+class Histogram(object):
+    """ Prometheus histogram with one label set per observed label values
+    """
+
+    def __init__(self, name, help, labels, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, values, amount):
+        """Records amount for the label values tuple"""
+        index = bisect_left(self.buckets, amount)
+        with self._lock:
+            series = self._series.get(values)
+            if series is None:
+                series = self._series[values] = [[0] * (len(self.buckets)
+                                                        + 1), 0.0]
+            series[0][index] += 1
+            series[1] += amount
+
+    def render(self):
+        lines = ['# HELP %s %s' % (self.name, self.help),
+                 '# TYPE %s histogram' % self.name]
+        with self._lock:
+            series = sorted((values, list(counts), total) for values,
+                            (counts, total) in self._series.iteritems())
+        for values, counts, total in series:
+            labels = ','.join('%s="%s"' % (label, value) for label, value
+                              in zip(self.labels, values))
+            sep = ',' if labels else ''
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                lines.append('%s_bucket{%s%sle="%s"} %i' % (self.name,
+                             labels, sep, bound, cumulative))
+            lines.append('%s_sum{%s} %r' % (self.name, labels, total))
+            lines.append('%s_count{%s} %i' % (self.name, labels, cumulative))
+        return '\n'.join(lines)
+
+REQUEST_SECONDS = Histogram('qzngn_request_seconds',
+                    'Request latency by resource class and method.',
+                    ('endpoint', 'status'))
+REQUEST_QUERIES = Histogram('qzngn_request_db_queries',
+                    'Db queries per request.', ('endpoint',), QUERY_BUCKETS)
+REQUEST_DB_SECONDS = Histogram('qzngn_request_db_seconds',
+                    'Time in db queries per request.', ('endpoint',))
+BCRYPT_SECONDS = Histogram('qzngn_bcrypt_seconds',
+                    'Time in bcrypt password hashing/checks.', ('op',))
+
+HISTOGRAMS = (REQUEST_SECONDS, REQUEST_QUERIES, REQUEST_DB_SECONDS,
+              BCRYPT_SECONDS)
+
+# In process caches published by render: (cache label, stats fn) where
+# stats returns the dict of cache.LRUCache.stats
+CACHES = []
+
+# (stats key, metric name, type, help)
+CACHE_METRICS = (
+    ('hits', 'qzngn_cache_hits_total', 'counter', 'Cache lookups found.'),
+    ('misses', 'qzngn_cache_misses_total', 'counter',
+     'Cache lookups not found or expired.'),
+    ('evictions', 'qzngn_cache_evictions_total', 'counter',
+     'Entries dropped to stay within maxsize.'),
+    ('size', 'qzngn_cache_size', 'gauge', 'Entries in the cache.'),
+    ('maxsize', 'qzngn_cache_maxsize', 'gauge', 'Entries the cache holds.'),
+)
+
+def register_cache(label, stats):
+    """Publishes the stats of a cache, labelled cache=label"""
+    CACHES.append((label, stats))
+
+def render_caches():
+    stats = [(label, get_stats()) for label, get_stats in CACHES]
+    lines = []
+    for key, name, kind, help in CACHE_METRICS:
+        lines.append('# HELP %s %s' % (name, help))
+        lines.append('# TYPE %s %s' % (name, kind))
+        for label, values in stats:
+            lines.append('%s{cache="%s"} %i' % (name, label, values[key]))
+    return '\n'.join(lines)
+
+@contextmanager
+def timed(histogram, *values):
+    start = time.time()
+    try:
+        yield
+    finally:
+        histogram.observe(values, time.time() - start)
+
+_endpoint_names = {}
+
+def endpoint_name(app):
+    """ 'ResourceClass.method' of the request, else the flask endpoint """
+    key = (request.endpoint, request.method)
+    name = _endpoint_names.get(key)
+    if name is None:
+        view = app.view_functions.get(request.endpoint)
+        view_class = getattr(view, 'view_class', None)
+        if view_class is not None:
+            name = '%s.%s' % (view_class.__name__, request.method.lower())
+        else:
+            name = request.endpoint or 'unknown'
+        _endpoint_names[key] = name
+    return name
+
+# Query count/time of the current request, from engine events of every
+# engine. Outside a request nothing is recorded. The start time is kept on
+# the statement's execution context, so a statement that raises (and gets
+# no after_cursor_execute) leaves nothing behind on the connection.
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_query(conn, cursor, statement, parameters, context,
+                  executemany):
+    if context is not None and has_request_context():
+        context.query_start = time.time()
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_query(conn, cursor, statement, parameters, context,
+                 executemany):
+    start = getattr(context, 'query_start', None)
+    if start is not None and has_request_context():
+        g.db_queries = g.get('db_queries', 0) + 1
+        g.db_seconds = g.get('db_seconds', 0.0) + time.time() - start
+
+def render():
+    """All metrics in the Prometheus text format"""
+    return '\n'.join([histogram.render() for histogram in HISTOGRAMS] +
+                     [render_caches()]) + '\n'
+
+def init_app(app):
+    """Installs the request hooks and the /metrics endpoint on app"""
+
+    @app.before_request
+    def start_request():
+        g.request_start = time.time()
+        g.db_queries = 0
+        g.db_seconds = 0.0
+
+    @app.after_request
+    def record_request(response):
+        start = g.get('request_start')
+        if start is None or request.endpoint == 'metrics':
+            return response
+        name = endpoint_name(app)
+        REQUEST_SECONDS.observe((name, response.status_code),
+                                time.time() - start)
+        REQUEST_QUERIES.observe((name,), g.db_queries)
+        REQUEST_DB_SECONDS.observe((name,), g.db_seconds)
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        return app.response_class(render(),
+                                  mimetype='text/plain; version=0.0.4')
@@ -5,42 +5,166 @@
 #   models.py      7/8/2018   pyflask  Db table design/models 
 #                                                for qzengine APIs 
 #
-#   Schema- models.db - tables: Users, Quizzes, Questions and Answer choices
+#   Schema- models.db - tables: Users, Quizzes, Questions, Answer choices,
+#           Attempts, Attempt answers and Quiz best scores
 #
 ###########################################################################
 
-from flask.ext.sqlalchemy import SQLAlchemy
-import textwrap, os
-from views import app, bcrypt
-
-file_path = os.path.abspath(os.getcwd())+"/models.db"
-app.config['SQLALCHEMY_DATABASE_URI']='sqlite:///'+file_path
-db = SQLAlchemy(app)
-
-MAXUSRS = 1000
-MAXQZ = 100
-MAXQS = 10000
-MAXANS = 50000
-
+from flask import request, has_request_context
+from flask.ext.sqlalchemy import SQLAlchemy, SignallingSession
+from flask.ext.bcrypt import Bcrypt
+import sqlalchemy
+from sqlalchemy import inspect, func, event, bindparam
+from sqlalchemy.engine import Engine
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.pool import QueuePool, StaticPool
+from sqlalchemy.orm import subqueryload, sessionmaker
+from sqlalchemy.sql.expression import UpdateBase
+from sqlalchemy.exc import IntegrityError, DisconnectionError
+import textwrap, threading, os
+from itertools import groupby
+from operator import itemgetter
+import config
+import logs
+
+READ_METHODS = frozenset(['GET', 'HEAD'])
+
+class RoutingSession(SignallingSession):
+    """ Session whose queries in GET/HEAD requests go to the read only
+        engine. Flushes and INSERT/UPDATE/DELETE statements go to the
+        primary, and once a session has written all its later queries
+        do too, so a request always reads its own writes.
+    """
+
+    def __init__(self, db, **options):
+        self.db = db
+        SignallingSession.__init__(self, db, **options)
+
+    def get_bind(self, mapper=None, clause=None):
+        if self._flushing or isinstance(clause, UpdateBase):
+            self.info['wrote'] = True
+        elif not self.info.get('wrote') and has_request_context() and \
+                request.method in READ_METHODS:
+            engine = self.db.get_read_engine(self.app)
+            if engine is not None:
+                return engine
+        return SignallingSession.get_bind(self, mapper, clause)
+
+class PooledSQLAlchemy(SQLAlchemy):
+    """ flask-sqlalchemy puts file sqlite dbs on a NullPool (a new
+        connection, and so new connect pragmas, per session). Here they
+        get a QueuePool like server dbs; pooled connections are used by
+        one thread at a time but not always the thread that opened them.
+        Adds the read only engine of RoutingSession.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.read_engines = {}
+        self._read_lock = threading.Lock()
+        SQLAlchemy.__init__(self, *args, **kwargs)
+
+    def create_session(self, options):
+        return sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def apply_driver_hacks(self, app, info, options):
+        SQLAlchemy.apply_driver_hacks(self, app, info, options)
+        if info.drivername.startswith('sqlite') and \
+                options.get('poolclass') is None:
+            options['poolclass'] = QueuePool
+            options.setdefault('connect_args', {})['check_same_thread'] = \
+                                                                    False
+        elif options.get('poolclass') is StaticPool:
+            # In memory sqlite keeps its one connection, there is no queue
+            for name in ('pool_size', 'max_overflow', 'pool_timeout'):
+                options.pop(name, None)
+
+    def get_read_engine(self, app):
+        """ Engine of app's READ_DATABASE_URI (default its primary URI),
+            None when reads are not routed: the URI is empty or an in
+            memory sqlite db, which a second engine could not share. Its
+            sqlite connections are opened query_only.
+        """
+        if app in self.read_engines:
+            return self.read_engines[app]
+        with self._read_lock:
+            if app not in self.read_engines:
+                self.read_engines[app] = self._create_read_engine(app)
+            return self.read_engines[app]
+
+    def _create_read_engine(self, app):
+        uri = app.config.get('READ_DATABASE_URI')
+        if uri is None:
+            uri = app.config['SQLALCHEMY_DATABASE_URI']
+        if not uri:
+            return None
+        info = make_url(uri)
+        if info.drivername.startswith('sqlite') and \
+                info.database in (None, '', ':memory:'):
+            return None
+        options = {'convert_unicode': True}
+        self.apply_pool_defaults(app, options)
+        self.apply_driver_hacks(app, info, options)
+        engine = sqlalchemy.create_engine(info, **options)
+        event.listen(engine, 'connect', query_only)
+        return engine
+
+# Bound to apps by views.create_app
+db = PooledSQLAlchemy()
+bcrypt = Bcrypt()
+
+def dispose_engines(app):
+    """ Closes the pooled connections of app's engines. A prefork server
+        calls this before forking, so workers open their own connections.
+    """
+    db.get_engine(app).dispose()
+    engine = db.read_engines.get(app)
+    if engine is not None:
+        engine.dispose()
+
+@event.listens_for(Engine, 'connect')
+def sqlite_pragmas(dbapi_conn, conn_record):
+    """Applies config.SQLITE_PRAGMAS to new sqlite connections"""
+    if 'sqlite' not in type(dbapi_conn).__module__:
+        return
+    cursor = dbapi_conn.cursor()
+    for name, value in config.SQLITE_PRAGMAS:
+        cursor.execute('PRAGMA %s=%s' % (name, value))
+    cursor.close()
+
+# A connection inherited from the parent process is never used, the pool
+# replaces it with a new one on checkout
+@event.listens_for(Engine, 'connect')
+def remember_pid(dbapi_conn, conn_record):
+    conn_record.info['pid'] = os.getpid()
+
+@event.listens_for(Engine, 'checkout')
+def check_pid(dbapi_conn, conn_record, conn_proxy):
+    if conn_record.info.get('pid', os.getpid()) != os.getpid():
+        conn_record.connection = conn_proxy.connection = None
+        raise DisconnectionError('Connection opened in process %s used in '
+                                 '%s' % (conn_record.info['pid'], os.getpid()))
+
+def query_only(dbapi_conn, conn_record):
+    """Makes a sqlite connection of the read engine refuse writes"""
+    if 'sqlite' in type(dbapi_conn).__module__:
+        dbapi_conn.execute('PRAGMA query_only=1')
+
+# Primary keys are allocated by the database when rows are flushed, so ids
+# are unique across worker processes and restarts. On sqlite AUTOINCREMENT
+# is used so ids of deleted rows are never handed out again.
 class User(db.Model):
     """ Defines the columns and keys for User table """
+    __table_args__ = {'sqlite_autoincrement': True}
+
     userid    = db.Column(db.Integer, primary_key=True)
-    username  = db.Column(db.String)
+    username  = db.Column(db.String, unique=True, index=True)
     password  = db.Column(db.String)
     role      = db.Column(db.String)
     qzscore   = db.Column(db.Integer)
 
     quizzes = db.relationship("Quiz", backref = "user")
 
-    def generate_userid():
-        """Generator fn for unique quiz id"""
-        for index in range(1, MAXUSRS, 1):
-            yield index
-
-    gen_userid = generate_userid()
-
     def __init__ (self, username, password, role, qzscore=0):
-        self.userid = self.gen_userid.next()
         self.username = username
         self.password = password
         self.role = role
@@ -51,29 +175,27 @@ class User(db.Model):
     
 class Quiz(db.Model):
     """ Defines the columns and keys for Quiz table """
+    __table_args__ = {'sqlite_autoincrement': True}
+
     qzid    = db.Column(db.Integer, primary_key=True)
     title   = db.Column(db.String(80), unique = True)
     difficulty_level = db.Column(db.String(80))
     text    = db.Column(db.String(80))
-    userid  = db.Column(db.Integer, db.ForeignKey('user.userid'))
+    userid  = db.Column(db.Integer, db.ForeignKey('user.userid'), index=True)
     no_ques = db.Column(db.Integer)
+    # Bumped by every admin change to the quiz or its questions, used for
+    # ETags and response cache keys
+    version = db.Column(db.Integer, nullable=False, default=1)
 
     questions = db.relationship("Question", backref = "quiz")
 
-    def generate_qzid():
-        """Generator fn for unique quiz id"""
-        for index in range(1, MAXQZ, 1):
-            yield index
-
-    gen_qzid = generate_qzid()
-
     def __init__ (self, title, difficulty_level, text, userid, no_ques=0):
-        self.qzid = self.gen_qzid.next()
         self.title = title
         self.difficulty_level = difficulty_level
         self.text = text
         self.userid = userid
         self.no_ques = no_ques
+        self.version = 1
 
     def __repr__(self):
         return '%i   %s     %s     %s     %i    %i' % (self.qzid, self.title, \
@@ -82,27 +204,32 @@ class Quiz(db.Model):
 
 class Question(db.Model):
     """ Defines the columns and keys for Question table """
+    __table_args__ = {'sqlite_autoincrement': True}
+
     qid      = db.Column(db.Integer, primary_key=True)
     ques_text= db.Column(db.String(80), unique = True)
     ans_text = db.Column(db.String(80))
-    qzid     = db.Column(db.Integer, db.ForeignKey('quiz.qzid'))
+    qzid     = db.Column(db.Integer, db.ForeignKey('quiz.qzid'), index=True)
     userid   = db.Column(db.Integer, db.ForeignKey('user.userid'))
+    # Answer key: bit i set if the i-th answer choice (ansid order) is
+    # correct, maintained on question create/patch. Used for grading.
+    answer_mask = db.Column(db.Integer, nullable=False, default=0)
+    no_choices  = db.Column(db.Integer, nullable=False, default=0)
 
-    anschoices = db.relationship("Anschoice", backref = "question")
-
-    def generate_quesid():
-        """Generator fn for unique ques id"""
-        for index in range(1, MAXQS, 1):
-            yield index
-
-    gen_qid = generate_quesid()
+    anschoices = db.relationship("Anschoice", backref = "question",
+                                 order_by = "Anschoice.ansid")
 
-    def __init__ (self, ques_text, ans_text, qzid, userid):
-        self.qid  = self.gen_qid.next()
+    def __init__ (self, ques_text, ans_text, qzid, userid, corrects=()):
         self.ques_text = ques_text
         self.ans_text  = ans_text
         self.qzid = qzid
         self.userid = userid
+        self.set_answer_key(corrects)
+
+    def set_answer_key(self, corrects):
+        """Sets answer_mask/no_choices from the correct flags of the answer
+           choices in ansid order"""
+        self.answer_mask, self.no_choices = answer_key_of(corrects)
 
     def __repr__(self):
         return '%i     %i          %s   %s    %i' % (self.qid, self.qzid, \
@@ -110,21 +237,15 @@ class Question(db.Model):
 
 class Anschoice(db.Model):
     """ Defines the columns and keys for Answer Choices table """
+    __table_args__ = {'sqlite_autoincrement': True}
+
     ansid      = db.Column(db.Integer, primary_key = True)
-    qzid       = db.Column(db.Integer, db.ForeignKey('quiz.qzid'))
-    qid        = db.Column(db.Integer, db.ForeignKey('question.qid'))
+    qzid       = db.Column(db.Integer, db.ForeignKey('quiz.qzid'), index=True)
+    qid        = db.Column(db.Integer, db.ForeignKey('question.qid'), index=True)
     ans_choice = db.Column(db.String(80))
     correct    = db.Column(db.Boolean)
 
-    def generate_ansid():
-        """Generator fn for unique ans id"""
-        for index in range(1, MAXANS, 1):
-            yield index
-
-    gen_ansid = generate_ansid()
-
     def __init__ (self, qzid, qid, ans_choice, correct):
-        self.ansid      = self.gen_ansid.next()
         self.qzid       = qzid
         self.qid        = qid
         self.ans_choice = ans_choice
@@ -134,59 +255,414 @@ class Anschoice(db.Model):
         return '%i        %i     %i     %s      %r' % (self.ansid, self.qzid, \
                 self.qid, self.ans_choice, self.correct)
 
+class Attempt(db.Model):
+    """ Defines the columns and keys for Attempt table, one row per quiz
+        attempt of a user. score/answered are only changed with atomic
+        sql increments.
+    """
+    __table_args__ = (db.Index('ix_attempt_user_quiz', 'userid', 'qzid',
+                               'attempt', unique=True),
+                      {'sqlite_autoincrement': True})
+
+    attemptid = db.Column(db.Integer, primary_key = True)
+    userid    = db.Column(db.Integer, db.ForeignKey('user.userid'),
+                          nullable=False)
+    qzid      = db.Column(db.Integer, db.ForeignKey('quiz.qzid'),
+                          nullable=False)
+    attempt   = db.Column(db.Integer, nullable=False)
+    total     = db.Column(db.Integer, nullable=False, default=0)
+    answered  = db.Column(db.Integer, nullable=False, default=0)
+    score     = db.Column(db.Integer, nullable=False, default=0)
+
+    def __init__ (self, userid, qzid, attempt, total, answered=0, score=0):
+        self.userid   = userid
+        self.qzid     = qzid
+        self.attempt  = attempt
+        self.total    = total
+        self.answered = answered
+        self.score    = score
+
+    def __repr__(self):
+        return '%i        %i     %i     %i     %i/%i  %i' % (self.attemptid, \
+                self.userid, self.qzid, self.attempt, self.answered, \
+                self.total, self.score)
+
+class AttemptAnswer(db.Model):
+    """ Defines the columns and keys for Attempt answers table, outcome of
+        each question answered in an attempt
+    """
+    __table_args__ = (db.UniqueConstraint('attemptid', 'qid'),
+                      {'sqlite_autoincrement': True})
+
+    id         = db.Column(db.Integer, primary_key = True)
+    attemptid  = db.Column(db.Integer, db.ForeignKey('attempt.attemptid'),
+                           nullable=False)
+    qzid       = db.Column(db.Integer, db.ForeignKey('quiz.qzid'), index=True)
+    qid        = db.Column(db.Integer, db.ForeignKey('question.qid'))
+    correct    = db.Column(db.Boolean, nullable=False)
+
+    def __init__ (self, attemptid, qzid, qid, correct):
+        self.attemptid = attemptid
+        self.qzid      = qzid
+        self.qid       = qid
+        self.correct   = correct
+
+    def __repr__(self):
+        return '%i        %i     %i     %i      %r' % (self.id, \
+                self.attemptid, self.qzid, self.qid, self.correct)
+
+class QuizBest(db.Model):
+    """ Defines the columns and keys for Quiz best table, best attempt
+        score of each taker of a quiz. Materialized leaderboard, ranked by
+        the (qzid, best_score) index.
+    """
+    __table_args__ = (db.UniqueConstraint('qzid', 'userid'),
+                      db.Index('ix_quiz_best_qzid_score', 'qzid',
+                               'best_score'),
+                      {'sqlite_autoincrement': True})
+
+    id         = db.Column(db.Integer, primary_key = True)
+    qzid       = db.Column(db.Integer, db.ForeignKey('quiz.qzid'),
+                           nullable=False)
+    userid     = db.Column(db.Integer, db.ForeignKey('user.userid'),
+                           nullable=False)
+    best_score = db.Column(db.Integer, nullable=False, default=0)
+
+    def __init__ (self, qzid, userid, best_score):
+        self.qzid       = qzid
+        self.userid     = userid
+        self.best_score = best_score
+
+    def __repr__(self):
+        return '%i        %i     %i     %i' % (self.id, self.qzid, \
+                self.userid, self.best_score)
+
+class Catalog(db.Model):
+    """ Defines the columns and keys for Catalog table, one row whose
+        version is bumped in the transaction of every admin write to
+        quizzes. Used for the quiz listing ETag.
+    """
+    id      = db.Column(db.Integer, primary_key = True)
+    version = db.Column(db.Integer, nullable=False, default=1)
 
-def db_init():
-    """ Initial config/population of the database tables """
+    def __init__ (self, id, version=1):
+        self.id      = id
+        self.version = version
 
-    #Using drop_all temporarily to prevent integrity error between
-    #subsequent runs. If db_init is not called this can be removed.
-    #this can also be called at the end of this fn
-    db.drop_all()
+    def __repr__(self):
+        return '%i        %i' % (self.id, self.version)
+
+CATALOG_ID = 1
+
+
+def is_correct(flag):
+    """Correct flags are bools, or "True"/"False" strings from takers"""
+    return flag is True or unicode(flag).lower() == u'true'
+
+def answer_key_of(corrects):
+    """ Returns (answer_mask, no_choices) of a list of correct flags """
+    mask = 0
+    index = -1
+    for index, flag in enumerate(corrects):
+        if is_correct(flag):
+            mask |= 1 << index
+    return mask, index + 1
+
+# Queries on the hot filters. Views use these so that every hot query is
+# covered by one of the indexes above and by check_query_plans()
+
+def user_by_name(username):
+    return User.query.filter_by(username=username)
+
+def quizzes_by_user(userid):
+    return Quiz.query.filter_by(userid=userid).order_by(Quiz.qzid)
+
+def questions_by_quiz(qzid):
+    return Question.query.filter_by(qzid=qzid).order_by(Question.qid)
+
+def questions_with_choices(**filters):
+    """ Questions matching filters, ordered by qid, with their answer
+        choices loaded by one extra query (instead of one per question)
+    """
+    return Question.query.filter_by(**filters).order_by(Question.qid).\
+                options(subqueryload(Question.anschoices))
+
+def choices_by_question(qid):
+    return Anschoice.query.filter_by(qid=qid).order_by(Anschoice.ansid)
+
+def choices_by_quiz(qzid):
+    return Anschoice.query.filter_by(qzid=qzid).order_by(Anschoice.ansid)
+
+def keyset_page(query, key, after, limit, columns):
+    """ Page of query: limit rows with key > after in key order, selecting
+        only columns. Served by the key's index however deep the page.
+    """
+    return query.with_entities(*columns).filter(key > after).\
+                order_by(None).order_by(key).limit(limit)
+
+def choices_of_questions(qzid, first, last):
+    """ (qid, ans_choice, correct) of the questions of a page, qid range
+        first..last of quiz qzid
+    """
+    return db.session.query(Anschoice.qid, Anschoice.ans_choice,
+                            Anschoice.correct).\
+                filter(Anschoice.qzid == qzid,
+                       Anschoice.qid.between(first, last)).\
+                order_by(Anschoice.qid, Anschoice.ansid)
+
+def attempts_by_user_quiz(userid, qzid):
+    """ Attempts of user at quiz, latest first, served by
+        ix_attempt_user_quiz
+    """
+    return Attempt.query.filter_by(userid=userid, qzid=qzid).\
+                order_by(Attempt.attempt.desc())
+
+def latest_attempt(userid, qzid):
+    return attempts_by_user_quiz(userid, qzid).first()
+
+def start_attempt(userid, qzid, total, answered=0, score=0, retries=3):
+    """ Adds the next attempt of user at quiz and flushes it. Two requests
+        numbering the same attempt are told apart by the unique index, the
+        loser rolls back and renumbers, so call this before any other
+        write of the request. Returns the Attempt.
+    """
+    for retry in range(retries):
+        last = db.session.query(func.max(Attempt.attempt)).\
+                    filter_by(userid=userid, qzid=qzid).scalar()
+        attempt = Attempt(userid, qzid, (last or 0) + 1, total, answered,
+                          score)
+        db.session.add(attempt)
+        try:
+            db.session.flush()
+            return attempt
+        except IntegrityError:
+            db.session.rollback()
+    raise IntegrityError('attempt', (userid, qzid), None)
+
+def add_to_attempt(attemptid, **deltas):
+    """ Atomically adds deltas (column name -> int) to an attempt """
+    cols = dict((getattr(Attempt, name), getattr(Attempt, name) + delta)
+                for name, delta in deltas.iteritems() if delta)
+    if not cols:
+        return 0
+    return Attempt.query.filter_by(attemptid=attemptid).update(cols,
+                                                  synchronize_session=False)
+
+def best_score_of(userid, qzid):
+    """ Best attempt score of user at quiz, None if never attempted """
+    return db.session.query(func.max(Attempt.score)).\
+                filter_by(userid=userid, qzid=qzid).scalar()
+
+def top_scores(qzid, limit):
+    """ (username, best_score) of the best takers of quiz, served by
+        ix_quiz_best_qzid_score
+    """
+    return db.session.query(User.username, QuizBest.best_score).\
+                select_from(QuizBest).\
+                join(User, User.userid == QuizBest.userid).\
+                filter(QuizBest.qzid == qzid).\
+                order_by(QuizBest.best_score.desc(), QuizBest.userid).\
+                limit(limit)
+
+def score_counts(qzid):
+    """ (best_score, number of takers) of quiz """
+    return db.session.query(QuizBest.best_score,
+                            func.count(QuizBest.userid)).\
+                filter_by(qzid=qzid).group_by(QuizBest.best_score)
+
+def quiz_version(qzid):
+    """ Version of quiz qzid, None if there is no such quiz """
+    return db.session.query(Quiz.version).filter_by(qzid=qzid).scalar()
+
+def catalog_version():
+    """ Version of the quiz catalog, a primary key lookup """
+    return db.session.query(Catalog.version).\
+                filter_by(id=CATALOG_ID).scalar() or 0
+
+def bump_catalog_version():
+    """ Atomically bumps the catalog version, adding its row if missing """
+    if not Catalog.query.filter_by(id=CATALOG_ID).update(
+                {Catalog.version: Catalog.version + 1},
+                synchronize_session=False):
+        db.session.add(Catalog(CATALOG_ID, 2))
+        db.session.flush()
+
+def bump_quiz_version(qzid, **cols):
+    """ Atomically bumps version of quiz qzid along with any column
+        updates in cols (column -> value or sql expression)
+    """
+    cols[Quiz.version] = Quiz.version + 1
+    bump_catalog_version()
+    return Quiz.query.filter_by(qzid=qzid).update(cols,
+                                                  synchronize_session=False)
+
+def hot_queries():
+    """ (name, query) of every hot query, with placeholder filter values """
+    return [('user_by_name', user_by_name('')),
+            ('quizzes_by_user', quizzes_by_user(0)),
+            ('questions_by_quiz', questions_by_quiz(0)),
+            ('choices_by_question', choices_by_question(0)),
+            ('choices_by_quiz', choices_by_quiz(0)),
+            ('quizzes_page', keyset_page(Quiz.query, Quiz.qzid, 0, 100,
+                                         [Quiz.qzid, Quiz.title])),
+            ('questions_page', keyset_page(questions_by_quiz(0),
+                                           Question.qid, 0, 100,
+                                           [Question.qid])),
+            ('choices_of_questions', choices_of_questions(0, 0, 100)),
+            ('attempts_by_user_quiz', attempts_by_user_quiz(0, 0)),
+            ('top_scores', top_scores(0, 10)),
+            ('score_counts', score_counts(0)),
+           ]
+
+def check_query_plans():
+    """ Runs EXPLAIN QUERY PLAN (sqlite only) for the hot queries and logs
+        the ones that scan a table instead of using an index.
+        Returns list of (name, plan) of those queries.
+    """
+    if db.engine.dialect.name != 'sqlite':
+        return []
+    unindexed = []
+    for name, query in hot_queries():
+        compiled = query.statement.compile(dialect=db.engine.dialect,
+                                    compile_kwargs={'literal_binds': True})
+        rows = db.session.execute('EXPLAIN QUERY PLAN %s' % compiled)
+        plan = [row[-1] for row in rows]
+        if [step for step in plan if step.startswith('SCAN') and
+                                     'INDEX' not in step]:
+            logs.warning_('Hot query %s does not use an index: %s',
+                          name, '; '.join(plan))
+            unindexed.append((name, plan))
+    return unindexed
+
+# Columns declared after their table was first released: table name ->
+# [(column name, DDL default of the existing rows)]
+ADDED_COLUMNS = {
+    'quiz': [('version', '1')],
+    'question': [('answer_mask', '0'), ('no_choices', '0')],
+    }
+BACKFILL_CHUNK = 1000
+
+def backfill_answer_keys():
+    """ Sets answer_mask/no_choices of every question from its answer
+        choices in ansid order, BACKFILL_CHUNK questions per statement
+    """
+    question = Question.__table__
+    update = question.update().where(question.c.qid == bindparam('b_qid')).\
+                values(answer_mask=bindparam('b_mask'),
+                       no_choices=bindparam('b_count'))
+    rows = db.session.query(Anschoice.qid, Anschoice.correct).\
+                order_by(Anschoice.qid, Anschoice.ansid).yield_per(
+                                                            BACKFILL_CHUNK)
+    keys = []
+    for qid, group in groupby(rows, itemgetter(0)):
+        mask, count = answer_key_of([correct for qid, correct in group])
+        keys.append(dict(b_qid=qid, b_mask=mask, b_count=count))
+        if len(keys) >= BACKFILL_CHUNK:
+            db.session.execute(update, keys)
+            keys = []
+    if keys:
+        db.session.execute(update, keys)
+    db.session.commit()
+
+# Run once when any of the columns of a table listed here was added
+BACKFILLS = {'question': backfill_answer_keys}
+
+def ensure_columns():
+    """ Adds ADDED_COLUMNS missing from tables created before they were
+        declared (create_all does not alter existing tables) and runs the
+        BACKFILLS of their tables. Returns the (table, column) names added.
+    """
+    inspector = inspect(db.engine)
+    quote = db.engine.dialect.identifier_preparer.quote
+    added = []
+    for table_name, columns in sorted(ADDED_COLUMNS.iteritems()):
+        existing = set(column['name'] for column in
+                       inspector.get_columns(table_name))
+        table = db.metadata.tables[table_name]
+        for name, default in columns:
+            if name in existing:
+                continue
+            column = table.c[name]
+            logs.info_('Adding column %s.%s', table_name, name)
+            db.engine.execute('ALTER TABLE %s ADD COLUMN %s %s %sDEFAULT %s'
+                              % (quote(table_name), quote(name),
+                                 column.type.compile(db.engine.dialect),
+                                 '' if column.nullable else 'NOT NULL ',
+                                 default))
+            added.append((table_name, name))
+    for table_name in sorted(set(table for table, name in added)):
+        if table_name in BACKFILLS:
+            logs.info_('Backfilling %s', table_name)
+            BACKFILLS[table_name]()
+    return added
+
+def ensure_indexes():
+    """ Creates indexes missing from tables created before they were
+        declared (create_all only adds indexes with new tables)
+    """
+    inspector = inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        existing = set(index['name'] for index in
+                       inspector.get_indexes(table.name))
+        for index in table.indexes:
+            if index.name not in existing:
+                logs.info_('Creating index %s', index.name)
+                index.create(db.engine)
+
+def db_init(reset=False):
+    """ Initial config/population of the database tables.
+        Tables are created if missing and populated only when empty, so
+        this can be run on every start. reset=True drops all tables first.
+    """
+
+    if reset:
+        db.drop_all()
+        import basicAuth as basicauth
+        basicauth.verified_creds.clear()
+        import leaderboard
+        leaderboard.clear()
 
     db.create_all()
+    ensure_columns()
+    ensure_indexes()
+    if Catalog.query.get(CATALOG_ID) is None:
+        db.session.add(Catalog(CATALOG_ID))
+        db.session.commit()
+    if User.query.first() is not None:
+        return None
 
     #populate User table
     admin1 = User("Archana", bcrypt.generate_password_hash("mypwd"), "admin")
-    db.session.add(admin1)
-    db.session.commit()
     user1 = User("User1", bcrypt.generate_password_hash("upwd"), "user")
-    db.session.add(user1)
-    db.session.commit()
     user2 = User("User2", bcrypt.generate_password_hash("u2pwd"), "user")
-    db.session.add(user2)
-    db.session.commit()
+    db.session.add_all([admin1, user1, user2])
+    db.session.flush()
 
     #populate Quiz table
-    qz1 = Quiz( "Python Basics  ", "Simple  ", "Explanation", 1, 2)
-    qz2 = Quiz( "Python Advanced", "Moderate", "No text    ", 1)
-    db.session.add(qz1)
-    db.session.add(qz2)
-    db.session.commit()
+    qz1 = Quiz( "Python Basics  ", "Simple  ", "Explanation", admin1.userid, 2)
+    qz2 = Quiz( "Python Advanced", "Moderate", "No text    ", admin1.userid)
+    db.session.add_all([qz1, qz2])
+    db.session.flush()
 
     #populate Questions table
     ques1 = Question("What does 'def foo(): pass do", 
-                      "A fn which does nothing",1,1)
+                      "A fn which does nothing", qz1.qzid, admin1.userid,
+                      [True, False, False])
     ques2 = Question("Is python an OOP l           ", 
-                      "Yes python is an OOP l",1,1)
-    db.session.add(ques1)
-    db.session.add(ques2)
-    db.session.commit()
+                      "Yes python is an OOP l", qz1.qzid, admin1.userid,
+                      [True, False, True])
+    db.session.add_all([ques1, ques2])
+    db.session.flush()
 
     #populate Answer choices table
-    ans1  = Anschoice(1, 1, "a. This function does nothing      ", True)
-    ans2  = Anschoice(1, 1, "b. This function returns a fn pass ", False)
-    ans3  = Anschoice(1, 1, "c. This function is not yet defined", False)
-    ans4  = Anschoice(1, 2, "a. Yes Python is object oriented   ", True)
-    ans5  = Anschoice(1, 2, "b. No Python is not object oriented", False)
-    ans6  = Anschoice(1, 2, "c. Python may not be used as OOP l ", True)
-    db.session.add(ans1)
-    db.session.add(ans2)
-    db.session.add(ans3)
-    db.session.add(ans4)
-    db.session.add(ans5)
-    db.session.add(ans6)
+    ans1  = Anschoice(qz1.qzid, ques1.qid, "a. This function does nothing      ", True)
+    ans2  = Anschoice(qz1.qzid, ques1.qid, "b. This function returns a fn pass ", False)
+    ans3  = Anschoice(qz1.qzid, ques1.qid, "c. This function is not yet defined", False)
+    ans4  = Anschoice(qz1.qzid, ques2.qid, "a. Yes Python is object oriented   ", True)
+    ans5  = Anschoice(qz1.qzid, ques2.qid, "b. No Python is not object oriented", False)
+    ans6  = Anschoice(qz1.qzid, ques2.qid, "c. Python may not be used as OOP l ", True)
+    db.session.add_all([ans1, ans2, ans3, ans4, ans5, ans6])
     db.session.commit()
 
     return None
 
-
@@ -8,27 +8,25 @@
 ###########################################################################
 
 from functools import wraps
-from flask import request, Response,json
+from flask import request, Response, json, g
 import logs
 
 def admin_required(f):
     """Decorator fn that authenticates user:admin """
     @wraps(f) #this fn allows the doc strings of dec fn to be displayed
     def role_decorator(*args, **kwargs):
-        # get username password from HTTP Basic Authentication header in 
-        # request- Authorization: 'Basic username:password'
+        # Role comes from the principal resolved by basicauth.login_required
+        # (users table or signed token), never from the client
         logs.debug_ ( "\n-------role.py required------\n")
-        auth = request.headers.get('Authorization')
-        # Auth header is in the form 'basic username:pwd role:admin'
+        principal = getattr(g, 'principal', None)
         import views
         from views import handle_invalid_usage, InvalidUsageException
-        if not auth:
+        if principal is None:
             response = handle_invalid_usage(InvalidUsageException \
                                             ('Error: Authorization required', \
                                             status_code=401))
             return response
-        role = auth.split()[2].split(':').pop()
-        if ("admin" != role):
+        if ("admin" != principal.role):
             logs.debug_ ( "Error role should be admin to access the resource")
             response = handle_invalid_usage(InvalidUsageException \
                         ('Error: Cannot access resource, role should be admin', \
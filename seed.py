@@ -0,0 +1,246 @@
+###########################################################################
+#
+#   File Name      Date        Owner           Description
+#   ---------    -------     ---------        ------------
+#   seed.py      7/8/2018     pyflask  Synthetic dataset generator for
+#                                            qzengine benchmarks
+#
+#  Runs models.db_init and then adds generated users, quizzes, questions,
+#  answer choices and attempt histories with bulk inserts. The data only
+#  depends on the counts and --seed. Ids follow the existing rows and are
+#  assigned here, so no ids are read back.
+#  All generated users share the password SEED_PASSWORD, it is hashed
+#  once (bcrypt per user would take hours at these volumes).
+#  Usage: python seed.py [--scale 1.0] [--users N] [--quizzes N]
+#             [--questions N] [--choices N] [--attempts N]
+#             [--detailed N] [--seed 1] [--reset]
+#
+###########################################################################
+
+import argparse, random, sys, time
+from sqlalchemy import func
+import models
+
+SEED_PASSWORD = 'seedpwd'
+INSERT_CHUNK = 10000
+ADMIN_EVERY = 100       # one admin per this many users
+DIFFICULTY = ('Simple', 'Moderate', 'Difficult')
+
+def next_id(column):
+    return (models.db.session.query(func.max(column)).scalar() or 0) + 1
+
+def bulk_insert(conn, table, rows):
+    """ Inserts tuples in table column order with executemany on the
+        driver cursor, INSERT_CHUNK rows at a time. Returns row count.
+    """
+    dialect = conn.dialect
+    statement = unicode(table.insert().compile(dialect=dialect))
+    names = [column.name for column in table.columns]
+    cursor = conn.connection.cursor()
+    count = 0
+    chunk = []
+    for row in rows:
+        chunk.append(row if dialect.positional else dict(zip(names, row)))
+        if len(chunk) >= INSERT_CHUNK:
+            cursor.executemany(statement, chunk)
+            count += len(chunk)
+            chunk = []
+    if chunk:
+        cursor.executemany(statement, chunk)
+        count += len(chunk)
+    cursor.close()
+    return count
+
+class Dataset(object):
+    """ Counts, first ids and the generated rows of each table """
+
+    def __init__(self, users, quizzes, questions, choices, attempts,
+                 detailed, seed):
+        self.users = users
+        self.quizzes = max(quizzes, 1)
+        self.questions = questions
+        self.choices = max(choices, 1)
+        self.attempts = attempts if questions else 0
+        self.detailed = min(detailed, self.attempts)
+        self.seed = seed
+        self.userid = next_id(models.User.userid)
+        self.qzid = next_id(models.Quiz.qzid)
+        self.qid = next_id(models.Question.qid)
+        self.ansid = next_id(models.Anschoice.ansid)
+        self.attemptid = next_id(models.Attempt.attemptid)
+        self.answerid = next_id(models.AttemptAnswer.id)
+        self.bestid = next_id(models.QuizBest.id)
+        self.password = models.bcrypt.generate_password_hash(SEED_PASSWORD)
+        self.admins = max(users // ADMIN_EVERY, 1) if users else 0
+
+    def rng(self, table):
+        """Rng of one table, so each table is reproducible on its own"""
+        return random.Random('%s-%s' % (self.seed, table))
+
+    def owner(self, quiz):
+        """userid of the admin owning the quiz'th generated quiz"""
+        if not self.admins:
+            return 1
+        return self.userid + (quiz % self.admins) * ADMIN_EVERY
+
+    def quiz_questions(self, quiz):
+        """(first question index, count) of the quiz'th quiz, questions
+           are split in contiguous blocks"""
+        first = quiz * self.questions // self.quizzes
+        last = (quiz + 1) * self.questions // self.quizzes
+        return first, last - first
+
+    def quiz_rows(self):
+        rng = self.rng('quiz')
+        for quiz in range(self.quizzes):
+            first, count = self.quiz_questions(quiz)
+            yield (self.qzid + quiz, u'Seed quiz %07i' % (self.qzid + quiz),
+                   rng.choice(DIFFICULTY), u'Generated quiz',
+                   self.owner(quiz), count, 1)
+
+    def question_and_choice_rows(self):
+        """ Yields ('question', row) and ('anschoice', row) """
+        rng = self.rng('question')
+        ansid = self.ansid
+        for quiz in range(self.quizzes):
+            qzid = self.qzid + quiz
+            first, count = self.quiz_questions(quiz)
+            for index in range(first, first + count):
+                qid = self.qid + index
+                mask = rng.randint(1, (1 << self.choices) - 1)
+                yield 'question', (qid, u'Seed question %08i?' % qid,
+                                   u'Seed answer %i' % qid, qzid,
+                                   self.owner(quiz), mask, self.choices)
+                for choice in range(self.choices):
+                    yield 'anschoice', (ansid, qzid, qid,
+                                        u'%s. choice %i' % ('abcdefgh'[choice
+                                        % 8], choice),
+                                        bool(mask >> choice & 1))
+                    ansid += 1
+
+    def attempt_rows(self):
+        """ Returns (attempts, detailed attempt answers, quiz bests,
+            score sums of users). Quizzes are picked with a skew towards
+            popular (low id) ones.
+        """
+        rng = self.rng('attempt')
+        takers = [self.userid + i for i in range(self.users)
+                  if i % ADMIN_EVERY] or [self.userid]
+        numbers = {}
+        bests = {}
+        sums = {}
+        attempts = []
+        answers = []
+        answerid = self.answerid
+        for index in range(self.attempts):
+            quiz = int(self.quizzes * rng.random() ** 3)
+            first, total = self.quiz_questions(quiz)
+            if not total:
+                continue
+            qzid = self.qzid + quiz
+            userid = rng.choice(takers)
+            attemptid = self.attemptid + len(attempts)
+            number = numbers[userid, qzid] = numbers.get((userid, qzid),
+                                                         0) + 1
+            skill = rng.random()
+            if index < self.detailed:
+                score = 0
+                for qid in range(self.qid + first, self.qid + first + total):
+                    correct = rng.random() < skill
+                    score += correct
+                    answers.append((answerid, attemptid, qzid, qid, correct))
+                    answerid += 1
+            else:
+                score = int(round(total * rng.betavariate(2, 2) * skill
+                                  * 2)) if total else 0
+                score = min(score, total)
+            attempts.append((attemptid, userid, qzid, number, total, total,
+                             score))
+            bests[qzid, userid] = max(bests.get((qzid, userid), 0), score)
+            sums[userid] = sums.get(userid, 0) + score
+        best_rows = [(self.bestid + i, qzid, userid, score) for i,
+                     ((qzid, userid), score) in
+                     enumerate(sorted(bests.iteritems()))]
+        return attempts, answers, best_rows, sums
+
+    def user_rows(self, sums):
+        for i in range(self.users):
+            userid = self.userid + i
+            role = u'admin' if i % ADMIN_EVERY == 0 else u'user'
+            yield (userid, u'seed%07i' % userid, self.password, role,
+                   sums.get(userid, 0))
+
+def seed(data):
+    """ Inserts the dataset in one transaction, returns row counts """
+    counts = {}
+    with models.db.engine.begin() as conn:
+        if conn.dialect.name == 'sqlite':
+            conn.execute('PRAGMA synchronous=OFF')
+        attempts, answers, bests, sums = data.attempt_rows()
+        counts['user'] = bulk_insert(conn, models.User.__table__,
+                                     data.user_rows(sums))
+        counts['quiz'] = bulk_insert(conn, models.Quiz.__table__,
+                                     data.quiz_rows())
+
+        # Questions and choices are generated together, choices are
+        # buffered a chunk at a time
+        rows = {'question': [], 'anschoice': []}
+        tables = {'question': models.Question.__table__,
+                  'anschoice': models.Anschoice.__table__}
+        counts['question'] = counts['anschoice'] = 0
+        for table, row in data.question_and_choice_rows():
+            rows[table].append(row)
+            if len(rows['anschoice']) >= INSERT_CHUNK:
+                for name in ('question', 'anschoice'):
+                    counts[name] += bulk_insert(conn, tables[name],
+                                                rows[name])
+                    rows[name] = []
+        for name in ('question', 'anschoice'):
+            counts[name] += bulk_insert(conn, tables[name], rows[name])
+
+        counts['attempt'] = bulk_insert(conn, models.Attempt.__table__,
+                                        attempts)
+        counts['attempt_answer'] = bulk_insert(conn,
+                            models.AttemptAnswer.__table__, answers)
+        counts['quiz_best'] = bulk_insert(conn, models.QuizBest.__table__,
+                                          bests)
+    if models.db.engine.dialect.name == 'sqlite':
+        models.db.engine.execute('ANALYZE')
+    return counts
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='qzngn dataset generator')
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='multiplies all the counts below')
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--quizzes', type=int, default=10000)
+    parser.add_argument('--questions', type=int, default=1000000)
+    parser.add_argument('--choices', type=int, default=4,
+                        help='answer choices per question')
+    parser.add_argument('--attempts', type=int, default=200000)
+    parser.add_argument('--detailed', type=int, default=1000,
+                        help='attempts with per question outcomes')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--reset', action='store_true',
+                        help='drop all tables first')
+    args = parser.parse_args(argv)
+
+    import views
+    start = time.time()
+    with views.create_app().app_context():
+        models.db_init(reset=args.reset)
+        scaled = lambda count: int(count * args.scale)
+        data = Dataset(scaled(args.users), scaled(args.quizzes),
+                       scaled(args.questions), args.choices,
+                       scaled(args.attempts), scaled(args.detailed),
+                       args.seed)
+        counts = seed(data)
+    for table in ('user', 'quiz', 'question', 'anschoice', 'attempt',
+                  'attempt_answer', 'quiz_best'):
+        print '%-15s %9i rows' % (table, counts[table])
+    print 'seeded in %.1fs (password of generated users: %s)' % (
+                                    time.time() - start, SEED_PASSWORD)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,155 @@
+###########################################################################
+#
+#   File Name        Date        Owner           Description
+#   -----------    --------    ---------       ----------------
+#   serializers.py  7/8/2018    pyflask   Response schemas for qzngn APIs
+#
+#  Schemas are compiled once at import and render model rows straight to
+#  JSON bytes, replacing the resource_fields dicts + marshal + jsonify
+#  that every view used to build per request.
+#  Output matches flask-restful fields: Integer None -> 0,
+#  String/Boolean None -> null.
+#
+###########################################################################
+
+from operator import attrgetter
+from flask import current_app, stream_with_context
+
+# Use the fastest json encoder available
+try:
+    import ujson as fastjson
+except ImportError:
+    try:
+        import simplejson as fastjson
+    except ImportError:
+        import json as fastjson
+
+def Integer(value):
+    return 0 if value is None else int(value)
+
+def String(value):
+    return None if value is None else unicode(value)
+
+def Boolean(value):
+    return None if value is None else bool(value)
+
+def Raw(value):
+    return value
+
+def Nested(schema):
+    """Converter for a relationship list rendered with schema"""
+    return schema.dump_many
+
+class Schema(object):
+    """ Ordered (name, converter) fields of a model row. Attribute lookup
+        is done with one attrgetter for all fields.
+    """
+
+    def __init__(self, *fields):
+        self.fields = fields
+        self.names = tuple(name for name, conv in fields)
+        self.convs = tuple(conv for name, conv in fields)
+        if len(self.names) == 1:
+            getter = attrgetter(self.names[0])
+            self._getter = lambda obj: (getter(obj),)
+        else:
+            self._getter = attrgetter(*self.names)
+        self._subsets = {}
+
+    def only(self, *names):
+        """Schema with the given subset of fields, compiled once"""
+        subset = self._subsets.get(names)
+        if subset is None:
+            fields = dict(self.fields)
+            subset = Schema(*[(name, fields[name]) for name in names])
+            self._subsets[names] = subset
+        return subset
+
+    def dump(self, obj):
+        """Render one row as a dict"""
+        return dict(zip(self.names, [conv(value) for conv, value in
+                                     zip(self.convs, self._getter(obj))]))
+
+    def dump_many(self, objs):
+        dump = self.dump
+        return [dump(obj) for obj in objs]
+
+ANSCHOICE = Schema(('ans_choice', String),
+                   ('correct', Boolean))
+
+QUIZ = Schema(('qzid', Integer),
+              ('title', String),
+              ('difficulty_level', String),
+              ('text', String),
+              ('no_ques', Integer))
+
+QUESTION = Schema(('qid', Integer),
+                  ('ques_text', String),
+                  ('ans_text', String),
+                  ('qzid', Integer),
+                  ('anschoices', Nested(ANSCHOICE)))
+
+USER = Schema(('userid', Integer),)
+
+# Export rows, flat (question, anschoice) and attempt results
+QUESTION_CHOICE = Schema(('qid', Integer),
+                         ('qzid', Integer),
+                         ('ques_text', String),
+                         ('ans_text', String),
+                         ('ansid', Integer),
+                         ('ans_choice', String),
+                         ('correct', Boolean))
+
+RESULT = Schema(('attemptid', Integer),
+                ('userid', Integer),
+                ('username', String),
+                ('qzid', Integer),
+                ('attempt', Integer),
+                ('answered', Integer),
+                ('total', Integer),
+                ('score', Integer))
+
+# Views of the above for quiz takers, answers are not included
+QUIZ_SUMMARY = QUIZ.only('qzid', 'title')
+QUESTION_TAKER = QUESTION.only('qid', 'ques_text', 'anschoices')
+
+SCHEMAS = dict(quiz=QUIZ, question=QUESTION, anschoice=ANSCHOICE, user=USER)
+
+_raw_schemas = {}
+
+def raw_schema(columns):
+    """Schema passing columns through unconverted, compiled once per
+       columns tuple"""
+    schema = _raw_schemas.get(columns)
+    if schema is None:
+        schema = Schema(*[(col, Raw) for col in columns])
+        _raw_schemas[columns] = schema
+    return schema
+
+def dumps(payload):
+    return fastjson.dumps(payload)
+
+def json_response(status_code=200, **payload):
+    """Response with payload encoded as json, payload values should
+       already be rendered by a schema"""
+    return body_response(dumps(payload), status_code)
+
+def body_response(body, status_code=200):
+    """Response for an already encoded json body"""
+    return current_app.response_class(body, status=status_code,
+                                      mimetype='application/json')
+
+def stream_response(chunks, mimetype, filename=None):
+    """Chunked response of a generator, run in the request context"""
+    response = current_app.response_class(stream_with_context(chunks),
+                                          mimetype=mimetype)
+    if filename is not None:
+        response.headers['Content-Disposition'] = \
+                                    'attachment; filename=%s' % filename
+    return response
+
+def not_modified(etag):
+    """304 response for a conditional GET whose ETag matched"""
+    response = current_app.response_class(status=304)
+    response.set_etag(etag)
+    return response
@@ -0,0 +1,50 @@
+###########################################################################
+#
+#   File Name      Date          Owner              Description
+#   ---------      ----          ----               -----------
+#   tokens.py     7/8/2018     pyflask    Signed bearer tokens for
+#                                            qzengine Restful APIs
+#
+#  Tokens are issued by POST /users and carry userid, username and role.
+#  They are signed (HMAC) with the app secret key and expire after
+#  TOKEN_MAX_AGE seconds, so checking one needs no db or bcrypt access.
+#
+###########################################################################
+
+from flask import current_app
+from itsdangerous import URLSafeTimedSerializer, BadSignature
+
+TOKEN_MAX_AGE = 900     #seconds
+TOKEN_SALT = 'qzngn-auth-token'
+
+_serializers = {}
+
+def get_serializer():
+    """Serializer of the current app's secret key"""
+    key = current_app.secret_key
+    serializer = _serializers.get(key)
+    if serializer is None:
+        serializer = _serializers[key] = URLSafeTimedSerializer(key,
+                                                        salt=TOKEN_SALT)
+    return serializer
+
+def generate_token(userid, username, role):
+    """Returns signed token for an authenticated user"""
+    return get_serializer().dumps(dict(userid=userid, username=username,
+                                       role=role))
+
+def load_token(token):
+    """Returns the claims dict of a valid token, None if the token is
+       malformed, tampered with or expired"""
+    try:
+        return get_serializer().loads(token, max_age=TOKEN_MAX_AGE)
+    except BadSignature:
+        #SignatureExpired is a subclass of BadSignature
+        return None
+
+def get_bearer_token(auth):
+    """Returns token from 'Bearer <token>' Authorization header or None"""
+    parts = auth.split()
+    if len(parts) == 2 and parts[0].lower() == 'bearer':
+        return parts[1]
+    return None
@@ -7,77 +7,138 @@
 #
 ###########################################################################
 
-from collections import OrderedDict
-from flask import request
+from collections import OrderedDict, namedtuple
+from flask import request, g
 import models
 import logs
 
-def get_user_from_hdr():
-    auth = request.headers.get('Authorization')
-    username = auth.split()[1].split(':')[0]
-    user_obj = models.User.query.filter_by(username=username).first()
-    userid = user_obj.userid
-    return userid, username
+def get_cur_user():
+    """Returns userid, username of the principal resolved for this request
+       by basicauth.login_required"""
+    principal = g.principal
+    return principal.userid, principal.username
 
-def serialize_to_json(fields, query_result, a=0):
+# Strong ETags of the user facing quiz resources, derived from the quiz
+# versions bumped by the admin write paths
+
+def quiz_list_etag():
+    return 'qzl-%i' % models.catalog_version()
+
+def quiz_etag(qzid):
+    """ETag of quiz qzid, None if there is no such quiz"""
+    version = models.quiz_version(qzid)
+    if version is None:
+        return None
+    return 'qz-%i-%i' % (qzid, version)
+
+def question_etag(qzid, qid):
+    """ETag of question qid, questions share the version of their quiz"""
+    version = models.quiz_version(qzid)
+    if version is None:
+        return None
+    return 'qn-%i-%i-%i' % (qzid, qid, version)
+
+def etag_matches(etag):
+    """True if the request's If-None-Match header matches etag"""
+    return etag is not None and request.if_none_match.contains(etag)
+
+# Keyset pagination of listings: ?after=<last key>&limit=&fields=a,b
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+PageArgs = namedtuple('PageArgs', 'after limit fields')
+
+def page_args(schema, key, default=None):
+    """ Returns PageArgs of the request. fields is the requested subset of
+        schema's fields in schema order (default, or all of them, if not
+        given) and always includes key. Raises ValueError with the error
+        message.
+    """
+    after = request.args.get('after', 0, type=int)
+    limit = request.args.get('limit', DEFAULT_LIMIT, type=int)
+    if after < 0 or limit < 1 or limit > MAX_LIMIT:
+        raise ValueError('Error: after should be >= 0 and limit between '
+                         '1 and %i' % MAX_LIMIT)
+    fields = request.args.get('fields')
+    if fields:
+        names = set(name.strip() for name in fields.split(',')
+                    if name.strip())
+        unknown = names.difference(schema.names)
+        if unknown:
+            raise ValueError('Error: Unknown fields %s, fields should be '
+                             'in %s' % (', '.join(sorted(unknown)),
+                                        ', '.join(schema.names)))
+        names.add(key)
+    else:
+        names = set(default or schema.names)
+    return PageArgs(after, limit,
+                    tuple(name for name in schema.names if name in names))
+
+def page_etag(etag, page):
+    """Listing ETag varied by the page args"""
+    return '%s-%i-%i-%s' % (etag, page.after, page.limit,
+                            '.'.join(page.fields))
+
+def columns_of(model, names):
+    return [getattr(model, name) for name in names]
+
+def next_cursor(rows, page, key):
+    """after value of the next page, None if rows is the last page"""
+    if len(rows) < page.limit:
+        return None
+    return getattr(rows[-1], key)
+
+def get_tables():
+    """ Tables that can be dumped for diagnostics, with the columns shown.
+        User passwords are never included
+    """
+    return OrderedDict([
+        ('user', (models.User, models.User.userid,
+                  ('userid', 'username', 'role', 'qzscore'))),
+        ('quiz', (models.Quiz, models.Quiz.qzid,
+                  ('qzid', 'title', 'difficulty_level', 'text', 'userid',
+                   'no_ques'))),
+        ('question', (models.Question, models.Question.qid,
+                  ('qid', 'qzid', 'ques_text', 'ans_text', 'userid'))),
+        ('anschoice', (models.Anschoice, models.Anschoice.ansid,
+                  ('ansid', 'qzid', 'qid', 'ans_choice', 'correct'))),
+        ('attempt', (models.Attempt, models.Attempt.attemptid,
+                  ('attemptid', 'userid', 'qzid', 'attempt', 'total',
+                   'answered', 'score'))),
+        ('attemptanswer', (models.AttemptAnswer, models.AttemptAnswer.id,
+                  ('id', 'attemptid', 'qzid', 'qid', 'correct'))),
+        ('quizbest', (models.QuizBest, models.QuizBest.id,
+                  ('id', 'qzid', 'userid', 'best_score'))),
+        ])
+
+def table_page(name, page=1, per_page=50):
+    """ Returns (columns, paginated rows) for one page of table name, or
+        None if there is no such table
     """
-    Serialize the query results into dict format so it can be
-    converted to json format using jsonify fn
+    tables = get_tables()
+    if name not in tables:
+        return None
+    model, order_col, columns = tables[name]
+    page_obj = model.query.order_by(order_col).paginate(page, per_page,
+                                                        error_out=False)
+    return columns, page_obj
+
+def display_tables(page=1, per_page=50):
+    """ Logs one page of every db table. Used on demand (startup/debugging),
+        never from request handlers; GET /admin/tables/<table> serves the
+        same snapshots over the API
     """
-    result = []
-    for i in query_result:
-        record = OrderedDict()
-        for field in fields:
-            if (field['relnshp']):
-                x = getattr(i, field['name'])
-                record[field['name']] = serialize_to_json(
-                                              field['subfields'], 
-                                              x)
-            else:
-                record[field['name']] = getattr(i, field['name'])
-        result.append(record)
-
-    return result
-
-def display_tables():
-    """ Displays db table entries after processing request """
-    prompt = '__________________________________________\n'\
-             'To view tables enter Yes/yes/y/No/no/n:'
-    #i = raw_input(prompt)
-    i = "yes"
-    if i.lower() in ('yes','y'):
-        import os
-        os.system('clear')
-        qry = models.User.query.all()
-        logs.debug_ ('User Table\n=============:\nUserid  Username'\
-                     '     Pwd     Role     QzScore\n')
-        for i in qry:
-            logs.debug_ (i)
+    if not logs.debug_enabled():
+        return None
+    for name in get_tables():
+        columns, page_obj = table_page(name, page, per_page)
+        logs.debug_ ('%s Table (page %i of %i, %i rows)\n=============:\n%s',
+                     name.capitalize(), page_obj.page, page_obj.pages,
+                     page_obj.total, '    '.join(columns))
+        for i in page_obj.items:
+            logs.debug_ ('    '.join([unicode(getattr(i, col))
+                                      for col in columns]))
         logs.debug_ ('\n------------------------------------------'\
                      '-----------------')
-
-        qry = models.Quiz.query.all()
-        logs.debug_ ('Quiz Table\n=============:\nQzid  Title     '\
-                 '    Difficulty Level   Text                Userid  No Ques\n')
-        for i in qry:
-            logs.debug_ (i)
-        logs.debug_ ('\n--------------------------------------------'
-                '--------------')
-
-        qry = models.Question.query.all()
-        logs.debug_ ('Questions Table\n================:\nQid Qzid      QText'\
-                      'Ans Text   Userid\n')
-        for i in qry:
-            logs.debug_ (i)
-        logs.debug_ ('\n------------------------------------------------------')
-
-        qry = models.Anschoice.query.all()
-        logs.debug_ ('Ans Choices Table\n================:\nAnsid  Qzid'
-                     '  Qid         Choices                          Correct\n')
-        for i in qry:
-            logs.debug_ (i)
-        logs.debug_ ('\n------------------------------------------------------')
-    else:
-        pass
     return None
-
@@ -0,0 +1,97 @@
+###########################################################################
+#
+#   File Name        Date        Owner           Description
+#   -----------    --------    ---------       ----------------
+#   validators.py   7/8/2018    pyflask   Request body validation for
+#                                             qzngn APIs
+#
+#  Replaces the reqparse.RequestParser each Resource built in __init__
+#  (flask-restful instantiates a Resource per request). Schemas are built
+#  once at import, the json body is validated in a single pass and the
+#  validated values are handed to the view as its data argument.
+#
+###########################################################################
+
+from functools import wraps
+from flask import request
+
+class ValidationError(Exception):
+    pass
+
+def Text(value):
+    """Strings are kept as is, numbers/bools are converted like str()"""
+    if isinstance(value, basestring):
+        return value
+    if isinstance(value, (int, long, float, bool)):
+        return unicode(value)
+    raise ValueError('should be a string')
+
+def List(*keys):
+    """Converter for a list of objects each having keys"""
+    def convert(value):
+        if not isinstance(value, list):
+            raise ValueError('should be a list')
+        for item in value:
+            if not isinstance(item, dict) or \
+               [key for key in keys if key not in item]:
+                raise ValueError('items should have %s' % ', '.join(keys))
+        return value
+    return convert
+
+class Arg(object):
+    """ One json body argument, same options as reqparse.add_argument """
+
+    def __init__(self, name, type=Text, required=False, help=None,
+                 default=None):
+        self.name = name
+        self.type = type
+        self.required = required
+        self.help = help or 'Missing %s' % name
+        self.default = default
+
+class RequestSchema(object):
+    """ Arguments of a json request body """
+
+    def __init__(self, *args):
+        self.args = args
+
+    def validate(self, body):
+        """ Returns dict of validated values. Arguments not in body are
+            left out unless they have a default. Raises ValidationError
+            with the argument's help message.
+        """
+        if body is None:
+            body = {}
+        elif not isinstance(body, dict):
+            raise ValidationError('Error: Request body should be a json object')
+        data = {}
+        for arg in self.args:
+            value = body.get(arg.name)
+            if value is None:
+                if arg.required:
+                    raise ValidationError(arg.help)
+                if arg.default is not None:
+                    data[arg.name] = arg.default
+                continue
+            try:
+                data[arg.name] = arg.type(value)
+            except ValueError as e:
+                raise ValidationError('%s (%s %s)' % (arg.help, arg.name, e))
+        return data
+
+def use_args(schema):
+    """Decorator that validates the json body with schema and passes the
+       values to the view as data=dict"""
+    def decorator(f):
+        @wraps(f)
+        def validate_decorator(*args, **kwargs):
+            from views import handle_invalid_usage, InvalidUsageException
+            try:
+                kwargs['data'] = schema.validate(
+                                        request.get_json(silent=True))
+            except ValidationError as e:
+                return handle_invalid_usage(InvalidUsageException(
+                                            e.args[0], status_code=400))
+            return f(*args, **kwargs)
+        return validate_decorator
+    return decorator
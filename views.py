@@ -11,22 +11,29 @@
 #
 ###########################################################################
 
-import os, logging
+import os, logging, itertools, operator
 from flask import Flask, request, json, jsonify, session
-from flask.ext.sqlalchemy import SQLAlchemy
-from flask.ext.restful import Api, Resource, reqparse, fields, marshal
-from flask.ext.bcrypt import Bcrypt
+from flask.ext.restful import Api, Resource
+from sqlalchemy.exc import IntegrityError
+import config
 import models 
 import utls 
 import role
-import basicauth 
+import basicAuth as basicauth
 import logs 
-
-app = Flask(__name__)
-bcrypt = Bcrypt(app)
-api = Api(app)
-
-app.secret_key = 'A0Zr98j/3yX R~XHH!jmN]LWX/,?RT'
+import tokens
+import serializers
+import validators
+import cache
+import grading
+import leaderboard
+import importer
+import exporter
+import metrics
+
+# Resources are added to api below and bound to apps by create_app
+api = Api()
+bcrypt = models.bcrypt
 
 class InvalidUsageException(Exception):
     """ Handles exceptions not caught by framework and sends response
@@ -45,7 +52,6 @@ class InvalidUsageException(Exception):
         rv['message'] = self.message
         return rv
 
-@app.errorhandler(InvalidUsageException)
 def handle_invalid_usage(error):
     response = jsonify(error.to_dict())
     response.status_code = error.status_code
@@ -57,37 +63,37 @@ class AdmnQuizzesAPI(Resource):
         for /api/quizzes endpoint 
     """
 
-    def __init__(self):
-        """ Uses RequestParser class of Flask restful to parse/validate
-            flask.request 
-        """
-        self.reqparse = reqparse.RequestParser()
-        self.reqparse.add_argument("title", type=str, required=True, 
-                                   help="No title given for quiz", 
-                                   location='json')
-        self.reqparse.add_argument("difficulty_level", type=str, required=True,
-                                   help="No difficulty level given for quiz", 
-                                   location='json')
-        self.reqparse.add_argument("text", type=str, required=True,
-                                   help="Quiz text not provided", 
-                                   location='json')
-        super(AdmnQuizzesAPI, self).__init__()
-
-
-    # GET /admin/quizzes
+    # Request body of post, validated by validators.use_args
+    post_args = validators.RequestSchema(
+        validators.Arg("title", required=True,
+                       help="No title given for quiz"),
+        validators.Arg("difficulty_level", required=True,
+                       help="No difficulty level given for quiz"),
+        validators.Arg("text", required=True,
+                       help="Quiz text not provided"))
+
+    # GET /admin/quizzes?after=0&limit=100&fields=qzid,title
     @basicauth.login_required
     @role.admin_required
     def get(self):
-        """Get all quizzes"""
+        """Get a page of quizzes"""
         logs.debug_ ("_______________________________________________")
-        logs.debug_ ("QuizzesAPI get fn: %s" %(request))
+        logs.debug_ ("QuizzesAPI get fn: %s", request)
+
+        try:
+            page = utls.page_args(serializers.QUIZ, 'qzid')
+        except ValueError as e:
+            return handle_invalid_usage(InvalidUsageException(e.args[0],
+                                                          status_code=400))
 
         # Query quizzes for this admin from quiz table
         # Should that be the case or should admin be able to see
         # other quizzes as well
-        userid, username = utls.get_user_from_hdr()
-        query_obj = models.Quiz.query.filter_by(userid=userid).all()
-        if not query_obj:
+        userid, username = utls.get_cur_user()
+        query_obj = models.keyset_page(models.quizzes_by_user(userid),
+                        models.Quiz.qzid, page.after, page.limit,
+                        utls.columns_of(models.Quiz, page.fields)).all()
+        if not query_obj and not page.after:
             response = handle_invalid_usage(InvalidUsageException
                                 ('Error: No quizzes found', status_code=404))
             return response
@@ -98,30 +104,25 @@ class AdmnQuizzesAPI(Resource):
             return response
 
         # Return response
-        resource_fields = {}
-        resource_fields['qzid'] =fields.Integer 
-        resource_fields['title']=fields.String 
-        resource_fields['difficulty_level'] =fields.String 
-        resource_fields['text'] =fields.String 
-        resource_fields['no_ques']=fields.Integer 
-
-        quizzes = marshal(query_obj, resource_fields)
-        response = jsonify(quizzes=quizzes)
+        quizzes = serializers.QUIZ.only(*page.fields).dump_many(query_obj)
+        response = serializers.json_response(quizzes=quizzes,
+                        next=utls.next_cursor(query_obj, page, 'qzid'))
         response.status_code = 200
         logs.info_(response)
-        utls.display_tables()
         return response
 
     # POST /admin/quizzes
     @basicauth.login_required
     @role.admin_required
-    def post(self):
+    @validators.use_args(post_args)
+    def post(self, data):
         """Add new quiz"""
-        logs.debug_ ("_________________________________________________")
-        logs.debug_ ("QuizzesAPI post fn: %s\nJson Request\n=============\n %s"
-                     %(request, request.json))
+        if logs.debug_enabled():
+            logs.debug_ ("_________________________________________________")
+            logs.debug_ ("QuizzesAPI post fn: %s\nJson Request\n=============\n %s",
+                         request, request.json)
 
-        userid, username = utls.get_user_from_hdr()
+        userid, username = utls.get_cur_user()
         if 'username' not in session:
             response = handle_invalid_usage(InvalidUsageException
                                 ('Error: No active session for this user found', 
@@ -129,39 +130,23 @@ class AdmnQuizzesAPI(Resource):
             
             return response
 
-        # Get values from request
-        args = self.reqparse.parse_args()
-        for key, value in args.iteritems():
-            if value is not None:
-                if (key == 'title'):
-                    title = request.json['title']
-                if (key == 'difficulty_level'):
-                    difficulty_level = request.json['difficulty_level']
-                if (key == 'text'):
-                    text = request.json['text']
-
         # Update tables
-        quiz_obj = models.Quiz(title, difficulty_level, text, userid)
+        quiz_obj = models.Quiz(data['title'], data['difficulty_level'],
+                               data['text'], userid)
         models.db.session.add(quiz_obj)
+        models.bump_catalog_version()
         models.db.session.commit()
+        cache.invalidate('quizzes')
         
         # Return response
         location = "/quizzes/%s" % quiz_obj.qzid
         query_obj = models.Quiz.query.filter_by(qzid=quiz_obj.qzid).all()
 
-        resource_fields =  {'qzid':fields.Integer, 
-                           'title':fields.String,
-                           'difficulty_level':fields.String,
-                           'text':fields.String,
-                           'no_ques':fields.Integer
-                          }
-                            
-        quiz = marshal(query_obj, resource_fields)
-        response = jsonify(quiz=quiz)
+        quiz = serializers.QUIZ.dump_many(query_obj)
+        response = serializers.json_response(quiz=quiz)
         response.status_code = 201
         response.location = location
         logs.info_(response)
-        utls.display_tables()
         return response
 
 class AdmnQuizAPI(Resource):
@@ -169,18 +154,11 @@ class AdmnQuizAPI(Resource):
         for /api/quizzes/<qzid> endpoint 
     """
 
-    def __init__(self):
-        """ Uses RequestParser class of Flask restful to parse/validate
-            flask.request 
-        """
-        self.reqparse = reqparse.RequestParser()
-        self.reqparse.add_argument("title", type=str, 
-                             help="No title given", location='json')
-        self.reqparse.add_argument("difficulty_level", type=str,
-                             help="No difficulty level set", location='json')
-        self.reqparse.add_argument("text", type=str, 
-                             help="text", location='json')
-        super(AdmnQuizAPI, self).__init__()
+    # Request body of patch, validated by validators.use_args
+    patch_args = validators.RequestSchema(
+        validators.Arg("title", help="No title given"),
+        validators.Arg("difficulty_level", help="No difficulty level set"),
+        validators.Arg("text", help="text"))
 
     # GET  /admin/quizzes/{qzid}
     @basicauth.login_required
@@ -188,10 +166,10 @@ class AdmnQuizAPI(Resource):
     def get(self, qzid):
         """Get quiz details"""
         logs.debug_ ("_________________________________________________")
-        logs.debug_ ("QuizAPI get fn: %s" %(request))
+        logs.debug_ ("QuizAPI get fn: %s", request)
 
         # Check if user is auth to get details of this quiz
-        userid, username = utls.get_user_from_hdr()
+        userid, username = utls.get_cur_user()
         query_obj = models.Quiz.query.filter_by(qzid=qzid).first()
         if (query_obj.userid != userid):
             response = handle_invalid_usage(InvalidUsageException
@@ -213,15 +191,8 @@ class AdmnQuizAPI(Resource):
             return response
 
         # Return response
-        resource_fields =  {'qzid':fields.Integer, 
-                           'title':fields.String,
-                           'difficulty_level':fields.String,
-                           'text':fields.String,
-                           'no_ques':fields.Integer
-                          }
-                            
-        quiz = marshal(query_obj, resource_fields)
-        response = jsonify(quiz=quiz)
+        quiz = serializers.QUIZ.dump_many(query_obj)
+        response = serializers.json_response(quiz=quiz)
         response.status_code = 200
         logs.info_(response)
         return response
@@ -229,12 +200,14 @@ class AdmnQuizAPI(Resource):
     # PATCH /admin/quizzes/{qzid}
     @basicauth.login_required
     @role.admin_required
-    def patch(self, qzid):
+    @validators.use_args(patch_args)
+    def patch(self, qzid, data):
         """Edit quiz details"""
-        logs.debug_ ("_________________________________________________")
-        logs.debug_ ("QuizAPI patch fn: %s \nJson Request\n=============\n %s" 
-                 %(request, request.json)) 
-        userid, username = utls.get_user_from_hdr()
+        if logs.debug_enabled():
+            logs.debug_ ("_________________________________________________")
+            logs.debug_ ("QuizAPI patch fn: %s \nJson Request\n=============\n %s", 
+                     request, request.json)
+        userid, username = utls.get_cur_user()
         if 'username' not in session:
             response = handle_invalid_usage(InvalidUsageException
                        ('Error: No active session for this user found', 
@@ -242,14 +215,9 @@ class AdmnQuizAPI(Resource):
             
             return response
 
-        # Get values from req
-        args = self.reqparse.parse_args()
-        cols = {}
-        no_data = True
-        for key, value in args.iteritems():
-            if value is not None:
-                no_data = False
-                cols[key] = request.json[key]
+        # Only the columns given in req are updated
+        cols = data
+        no_data = not cols
 
         # Check if user is auth to update this quiz
         query_obj = models.Quiz.query.filter_by(qzid=qzid).first()
@@ -268,23 +236,17 @@ class AdmnQuizAPI(Resource):
             return response
 
         # Update tables
-        models.Quiz.query.filter_by(qzid=qzid).update(cols)
+        models.bump_quiz_version(qzid, **cols)
         models.db.session.commit()
+        cache.invalidate('quizzes')
+        cache.invalidate('quiz', qzid)
 
         # Return response
         query_obj = models.Quiz.query.filter_by(qzid=qzid).all()
-        resource_fields =  {'qzid':fields.Integer, 
-                           'title':fields.String,
-                           'difficulty_level':fields.String,
-                           'text':fields.String,
-                           'no_ques':fields.Integer
-                          }
-                            
-        quiz = marshal(query_obj, resource_fields)
-        response = jsonify(quiz=quiz)
+        quiz = serializers.QUIZ.dump_many(query_obj)
+        response = serializers.json_response(quiz=quiz)
         response.status_code = 200
         logs.info_(response)
-        utls.display_tables()
         return response
 
     # DELETE  /admin/quizzes/{qzid}
@@ -293,10 +255,10 @@ class AdmnQuizAPI(Resource):
     def delete(self, qzid):
         """Delete quiz"""
         logs.debug_ ("_________________________________________________")
-        logs.debug_ ("QuizAPI delete fn: %s" %(request))
+        logs.debug_ ("QuizAPI delete fn: %s", request)
 
         # Check if user is auth to delete this quiz
-        userid, username = utls.get_user_from_hdr()
+        userid, username = utls.get_cur_user()
         query_obj = models.Quiz.query.filter_by(qzid=qzid).first()
         if  (query_obj.userid != userid):
             response = handle_invalid_usage(InvalidUsageException
@@ -312,20 +274,25 @@ class AdmnQuizAPI(Resource):
                         status_code=404))
             return response
      
-        # Delete all questions table entries for the quiz
-        models.Question.query.join(models.Quiz).filter(models.Question.qzid == qzid).\
-                delete()
-        
         # Delete all Ans choices table entries for quiz
-        models.Anschoice.query.join(models.Quiz).filter(models.Anschoice.qzid == qzid).\
-                delete()
+        models.Anschoice.query.filter_by(qzid=qzid).delete()
+
+        # Delete attempts at the quiz, their points come off user scores
+        grading.remove_quiz(qzid)
+
+        # Delete all questions table entries for the quiz
+        models.Question.query.filter_by(qzid=qzid).delete()
 
         # Delete quiz
         models.Quiz.query.filter(models.Quiz.qzid == qzid).delete()
+        models.bump_catalog_version()
         models.db.session.commit()
+        cache.invalidate('quizzes')
+        cache.invalidate('quiz', qzid)
+        cache.invalidate('question', qzid)
+        leaderboard.drop(qzid)
         
         # Return response
-        utls.display_tables()
         return 204
 
 class AdmnQuestionsAPI(Resource):
@@ -333,31 +300,24 @@ class AdmnQuestionsAPI(Resource):
         for /api/quizzes/<qzid>/questions endpoint 
     """
 
-    def __init__(self):
-        """ Uses RequestParser class of Flask restful to parse/validate
-            flask.request 
-        """
+    # Request body of post, validated by validators.use_args
+    post_args = validators.RequestSchema(
+        validators.Arg("ques_text", required=True,
+                       help="No ques text provided"),
+        validators.Arg("ans_text", required=True, help="No ans given"),
+        validators.Arg("anschoices", type=validators.List("answer", "correct"),
+                       required=True, help="No choices given"))
 
-        self.reqparse = reqparse.RequestParser()
-        self.reqparse.add_argument("ques_text", type=str, required=True,
-                             help="No ques text provided", location='json')
-        self.reqparse.add_argument("ans_text", type=str, required=True,
-                             help="No ans given", location='json')
-        self.reqparse.add_argument("anschoices", type=list, required=True,
-                             help="No choices given", location='json')
-        super(AdmnQuestionsAPI, self).__init__()
-
-
-    # GET /admin/questions/{qzid}/questions
+    # GET /admin/questions/{qzid}/questions?after=0&limit=100&fields=
     @basicauth.login_required
     @role.admin_required
     def get(self, qzid):
-        """Get all questions for quiz"""
+        """Get a page of questions for quiz"""
         logs.debug_ ("_________________________________________________")
-        logs.debug_ ("QuestionisAPI get fn: %s" %(request))
+        logs.debug_ ("QuestionisAPI get fn: %s", request)
 
         # Check if user is auth to get details of this ques
-        userid, username = utls.get_user_from_hdr()
+        userid, username = utls.get_cur_user()
         query_obj = models.Quiz.query.filter_by(qzid=qzid).first()
         if  (query_obj.userid != userid):
             response = handle_invalid_usage(InvalidUsageException
@@ -371,71 +331,82 @@ class AdmnQuestionsAPI(Resource):
                         status_code=404))
             return response
 
-        # Query from questions table
-        query_obj = models.Question.query.join(models.Quiz).join(models.Anschoice).\
-                      filter(models.Quiz.qzid == qzid).all()
-        if not query_obj:
+        try:
+            page = utls.page_args(serializers.QUESTION, 'qid')
+        except ValueError as e:
+            return handle_invalid_usage(InvalidUsageException(e.args[0],
+                                                          status_code=400))
+
+        # Query from questions table, only the requested columns
+        columns = [name for name in page.fields if name != 'anschoices']
+        query_obj = models.keyset_page(models.questions_by_quiz(qzid),
+                        models.Question.qid, page.after, page.limit,
+                        utls.columns_of(models.Question, columns)).all()
+        if not query_obj and not page.after:
             response = handle_invalid_usage(InvalidUsageException
                         ('Error: No question for quiz found', 
                          status_code=404))
             
             return response
+        questions = serializers.QUESTION.only(*columns).dump_many(query_obj)
+
+        # Ans choices of the page's qid range in one query
+        if 'anschoices' in page.fields and query_obj:
+            choices = dict((qid, serializers.ANSCHOICE.dump_many(rows))
+                           for qid, rows in itertools.groupby(
+                                models.choices_of_questions(qzid,
+                                    query_obj[0].qid, query_obj[-1].qid),
+                                operator.attrgetter('qid')))
+            for question, row in zip(questions, query_obj):
+                question['anschoices'] = choices.get(row.qid, [])
 
         # Return response
-        ans_fields = {'ans_choice':fields.String,
-                      'correct':fields.Boolean
-                     }
-        resource_fields =  {'qid':fields.Integer, 
-                           'ques_text':fields.String,
-                           'ans_text':fields.String,
-                           'qzid':fields.Integer,
-                           'anschoices':fields.Nested(ans_fields)
-                          }
-                            
-        questions = marshal(query_obj, resource_fields)
-        response = jsonify(questions=questions)
+        response = serializers.json_response(questions=questions,
+                        next=utls.next_cursor(query_obj, page, 'qid'))
         response.status_code = 200
-        utls.display_tables()
         logs.info_(response)
         return response
 
     # POST /admin/quizzes/{qzid}/questions
     @basicauth.login_required
     @role.admin_required
-    def post(self, qzid):
+    @validators.use_args(post_args)
+    def post(self, qzid, data):
         """Add question to quiz"""
-        logs.debug_ ("_________________________________________________")
-        logs.debug_ ("QuestionsAPI post fn: %s \nJson Request\n=============\n %s" 
-                      %(request, request.json))
+        if logs.debug_enabled():
+            logs.debug_ ("_________________________________________________")
+            logs.debug_ ("QuestionsAPI post fn: %s \nJson Request\n=============\n %s", 
+                          request, request.json)
 
-        # Get userid from hdr
-        userid, username = utls.get_user_from_hdr()
+        # Check if user is auth to add questions to this quiz
+        userid, username = utls.get_cur_user()
+        query_obj = models.Quiz.query.filter_by(qzid=qzid).first()
+        if query_obj is None:
+            response = handle_invalid_usage(InvalidUsageException
+                        ('Error: Quiz not found', status_code=404))
+            return response
+        if  (query_obj.userid != userid):
+            response = handle_invalid_usage(InvalidUsageException
+                    ('Error: Unauthorized Username for this quiz', \
+                     status_code=401))
+            return response
         if 'username' not in session:
             response = handle_invalid_usage(InvalidUsageException
                         ('Error: No active session for this user found', 
                          status_code=404))
             return response
 
-        # Get data from req
-        args = self.reqparse.parse_args()
-        for key, value in args.iteritems():
-            if value is not None:
-                if (key == 'ques_text'):
-                    ques_text = request.json['ques_text']
-                if (key == 'ans_text'):
-                    ans_text = request.json['ans_text']
-                if (key == 'anschoices'):
-                    anschoices = request.json['anschoices']
-
         # Post new data to table
-        qn_obj = models.Question(ques_text, ans_text, qzid, userid)
+        anschoices = data['anschoices']
+        qn_obj = models.Question(data['ques_text'], data['ans_text'], qzid,
+                                 userid, [choice["correct"]
+                                          for choice in anschoices])
         models.db.session.add(qn_obj)
+        models.db.session.flush()   #db allocates qn_obj.qid
 
         # Update correspnoding relationship tables 
         #Quiz table
-        L = models.Quiz.query.filter_by(qzid = qzid).first()
-        models.Quiz.query.filter_by(qzid = qzid).update(dict(no_ques=
-                                                      (L.no_ques+1)))
+        models.bump_quiz_version(qzid, no_ques=models.Quiz.no_ques+1)
 
         # Ans choices table 
         ansidL = []
@@ -447,28 +418,62 @@ class AdmnQuestionsAPI(Resource):
                                     )
             models.db.session.add(ans_obj)
         models.db.session.commit()
+        cache.invalidate('quiz', qzid)
 
         # Return response
         location = "/quizzes/%s/questions/%s" % (qzid, qn_obj.qid)
-        query_obj = models.Question.query.join(models.Anschoice).\
-                         filter(models.Question.qid == qn_obj.qid).all()
+        query_obj = models.questions_with_choices(qid=qn_obj.qid).all()
         qid = qn_obj.qid
-        ans_fields = {'ans_choice':fields.String,
-                      'correct':fields.Boolean
-                     }
-        resource_fields =  {'ques_text':fields.String,
-                           'ans_text':fields.String,
-                           'qzid':fields.Integer,
-                           'qid':fields.Integer,
-                           'anschoices':fields.Nested(ans_fields)
-                          }
-                            
-        question = marshal(query_obj, resource_fields)
-        response = jsonify(question=question)
+        question = serializers.QUESTION.dump_many(query_obj)
+        response = serializers.json_response(question=question)
         response.location = location
         response.status_code = 201
         logs.info_(response)
-        utls.display_tables()
+        return response
+
+class AdmnQuestionsImportAPI(Resource):
+    """ Class that defines methods for processing post requests 
+        for /admin/quizzes/<qzid>/questions/import endpoint. Bulk import
+        of questions streamed as NDJSON, see importer.py
+    """
+
+    # POST /admin/quizzes/{qzid}/questions/import
+    @basicauth.login_required
+    @role.admin_required
+    def post(self, qzid):
+        """Import questions to quiz"""
+        logs.debug_ ("_________________________________________________")
+        logs.debug_ ("QuestionsImportAPI post fn: %s", request)
+
+        # Check if user is auth to add questions to this quiz
+        userid, username = utls.get_cur_user()
+        query_obj = models.Quiz.query.filter_by(qzid=qzid).first()
+        if query_obj is None:
+            response = handle_invalid_usage(InvalidUsageException
+                        ('Error: Quiz not found', status_code=404))
+            return response
+        if  (query_obj.userid != userid):
+            response = handle_invalid_usage(InvalidUsageException
+                    ('Error: Unauthorized Username for this quiz', \
+                     status_code=401))
+            return response
+        if 'username' not in session:
+            response = handle_invalid_usage(InvalidUsageException
+                       ('Error: No active session for this user found', 
+                        status_code=404))
+            return response
+
+        # Body is read line by line, never loaded whole
+        result = importer.import_questions(request.stream, qzid, userid,
+                                           AdmnQuestionsAPI.post_args)
+        if result.imported:
+            cache.invalidate('quiz', qzid)
+
+        # Return response
+        response = serializers.json_response(qzid=qzid, **result.to_dict())
+        response.location = "/quizzes/%s/questions" % qzid
+        response.status_code = 201 if result.imported else 400
+        logs.info_(response)
         return response
 
 class AdmnQuestionAPI(Resource):
@@ -476,19 +481,12 @@ class AdmnQuestionAPI(Resource):
         for /api/quizzes/<qzid>/questions/<qid> endpoint 
     """
 
-    def __init__(self):
-        """ Uses RequestParser class of Flask restful to parse/validate
-            flask.request 
-        """
-
-        self.reqparse = reqparse.RequestParser()
-        self.reqparse.add_argument('ques_text', type=str, required=True,
-                             help='No title given', location='json')
-        self.reqparse.add_argument('ans_text', type=str, default="",
-                             help='No ans provided', location='json')
-        self.reqparse.add_argument('anschoices', type=str, default="",
-                             help='No anschoices provided', location='json')
-        super(AdmnQuestionAPI, self).__init__()
+    # Request body of patch, validated by validators.use_args
+    patch_args = validators.RequestSchema(
+        validators.Arg('ques_text', required=True, help='No title given'),
+        validators.Arg('ans_text', default="", help='No ans provided'),
+        validators.Arg('anschoices', type=validators.List("answer", "correct"),
+                       default=[], help='No anschoices provided'))
 
     # GET  /admin/quizzes/{qzid}/questions/{qid}
     @basicauth.login_required
@@ -496,10 +494,10 @@ class AdmnQuestionAPI(Resource):
     def get(self, qzid, qid):
         """Get question qid for quiz"""
         logs.debug_ ("_________________________________________________")
-        logs.debug_ ("QuestionAPI get fn: %s" %(request))
+        logs.debug_ ("QuestionAPI get fn: %s", request)
 
         # Check if user is auth to get details of this ques
-        userid, username = utls.get_user_from_hdr()
+        userid, username = utls.get_cur_user()
         query_obj = models.Question.query.filter_by(qid=qid).first()
         if (query_obj.userid != userid):
             response = handle_invalid_usage(InvalidUsageException
@@ -514,42 +512,32 @@ class AdmnQuestionAPI(Resource):
             return response
 
         # Query Question table
-        query_obj = models.Question.query.join(models.Anschoice).filter(
-                     models.Question.qid == qid,models.Question.qzid == qzid).all()
+        query_obj = models.questions_with_choices(qid=qid, qzid=qzid).all()
         if not query_obj:
             response = handle_invalid_usage(InvalidUsageException
                        ('Error: Question not found', status_code=404))
             return response
 
         # Return response
-        ans_fields = {'ans_choice':fields.String,
-                      'correct':fields.Boolean
-                     }
-        resource_fields =  {'qid':fields.Integer,
-                           'ques_text':fields.String,
-                           'ans_text':fields.String,
-                           'qzid':fields.Integer,
-                           'anschoices':fields.Nested(ans_fields)
-                          }
-                            
-        question = marshal(query_obj, resource_fields)
-        response = jsonify(question=question)
+        question = serializers.QUESTION.dump_many(query_obj)
+        response = serializers.json_response(question=question)
         response.status_code = 200
         logs.info_(response)
-        utls.display_tables()
         return response
 
     # PATCH /admin/quizzes/{qzid}/questions/{qid}
     @basicauth.login_required
     @role.admin_required
-    def patch(self, qzid, qid):
+    @validators.use_args(patch_args)
+    def patch(self, qzid, qid, data):
         """Add question to quiz"""
-        logs.debug_ ("_________________________________________________")
-        logs.debug_ ("QuestionAPI patch fn: %s \nJson Request\n=============\n %s" 
-                     %(request, request.json))
+        if logs.debug_enabled():
+            logs.debug_ ("_________________________________________________")
+            logs.debug_ ("QuestionAPI patch fn: %s \nJson Request\n=============\n %s", 
+                         request, request.json)
 
         # Check if user is auth to update this ques
-        userid, username = utls.get_user_from_hdr()
+        userid, username = utls.get_cur_user()
         query_obj = models.Question.query.filter_by(qid=qid).first()
         if  (query_obj.userid != userid):
             response = handle_invalid_usage(InvalidUsageException
@@ -572,52 +560,40 @@ class AdmnQuestionAPI(Resource):
                             status_code=400))
             return response
 
-        args = self.reqparse.parse_args()
-        for key, value in args.iteritems():
-            if value is not None:
-                if (key == 'ques_text'):
-                    ques_text = request.json['ques_text']
-                if (key == 'ans_text'):
-                    ans_text = request.json['ans_text']
-                if (key == 'anschoices'):
-                    anschoices = request.json['anschoices']
-
-
         # Update all table entries with input data
-        models.Question.query.filter_by(qid = qid).\
-                update(dict(ques_text=ques_text, ans_text=ans_text))
+        anschoices = data['anschoices']
 
         # Updating correspnoding relationship tables
         # Ans choices table 
-        query_obj = models.Anschoice.query.filter_by(qid = qid)
+        query_obj = models.choices_by_question(qid).all()
+        corrects = [choice.correct for choice in query_obj]
         index = 0
-        for choice in query_obj:
+        for choice in query_obj[:len(anschoices)]:
             ansid = query_obj[index].ansid
             ans_choice = anschoices[index]["answer"]
             correct    = anschoices[index]["correct"]
             models.Anschoice.query.filter_by(ansid = ansid).\
                   update(dict(ans_choice = ans_choice, correct = correct))  
+            corrects[index] = correct
             index += 1
+
+        # Question table, answer key follows the updated choices
+        answer_mask, no_choices = models.answer_key_of(corrects)
+        models.Question.query.filter_by(qid = qid).\
+                update(dict(ques_text=data['ques_text'],
+                            ans_text=data['ans_text'],
+                            answer_mask=answer_mask,
+                            no_choices=no_choices))
+        models.bump_quiz_version(qzid)
         models.db.session.commit()
+        cache.invalidate('question', qzid, qid)
 
         # Return response
-        query_obj = models.Question.query.join(models.Anschoice).filter(
-                                         models.Question.qid == qid).all()
-        ans_fields = {'ans_choice':fields.String,
-                      'correct':fields.Boolean
-                     }
-        resource_fields =  {'qid':fields.Integer,
-                           'ques_text':fields.String,
-                           'ans_text':fields.String,
-                           'qzid':fields.Integer,
-                           'anschoices':fields.Nested(ans_fields)
-                          }
-                            
-        question = marshal(query_obj, resource_fields)
-        response = jsonify(question=question)
+        query_obj = models.questions_with_choices(qid=qid).all()
+        question = serializers.QUESTION.dump_many(query_obj)
+        response = serializers.json_response(question=question)
         response.status_code = 200
         logs.info_(response)
-        utls.display_tables()
         return response
 
     # DELETE  /admin/quizzes/{qzid}/questions/{qid}
@@ -626,10 +602,10 @@ class AdmnQuestionAPI(Resource):
     def delete(self, qzid, qid):
         """Delete question"""
         logs.debug_ ("_________________________________________________")
-        logs.debug_ ("QuestionAPI del fn: %s" %(request.url))
+        logs.debug_ ("QuestionAPI del fn: %s", request.url)
 
         # Check if user is auth to del this ques
-        userid, username = utls.get_user_from_hdr()
+        userid, username = utls.get_cur_user()
         query_obj = models.Question.query.filter_by(qid=qid).first()
         if  (query_obj.userid != userid):
             response = handle_invalid_usage(InvalidUsageException
@@ -645,22 +621,25 @@ class AdmnQuestionAPI(Resource):
 
 
         # Updating no_ques col in quiz table
-        L = models.Quiz.query.filter_by(qzid = qzid).first()
-        models.Quiz.query.filter_by(qzid = qzid).\
-                         update(dict(no_ques= (L.no_ques-1)))
+        models.bump_quiz_version(qzid, no_ques=models.Quiz.no_ques-1)
 
         # Deleting Ans choices table entries for qid
-        models.Anschoice.query.filter(models.Anschoice.qid == qid).delete()
+        models.Anschoice.query.filter_by(qid=qid).delete()
+
+        # Answers to the question come off attempts, user and best scores
+        grading.remove_question(qzid, qid)
 
         # Finally deleting entries from Question table
         models.Question.query.filter_by(qid = qid).delete()
         models.db.session.commit()
+        cache.invalidate('quiz', qzid)
+        cache.invalidate('question', qzid, qid)
+        leaderboard.drop(qzid)
 
         # Return response
-        response = jsonify(qid=qid)
+        response = serializers.json_response(qid=qid)
         response.status_code = 204
         logs.info_(response)
-        utls.display_tables()
         return response
 
 
@@ -672,37 +651,27 @@ class UsersAPI(Resource):
         processed.
         Flask session is created once the user is created(post) or 
         logs in(get).
+        A short lived signed token is returned which can be used as
+        'Authorization: Bearer token' on the other endpoints.
     """
 
-    def __init__(self):
-        """ Uses RequestParser class of Flask restful to parse/validate
-            flask.request 
-        """
-        self.reqparse = reqparse.RequestParser()
-        self.reqparse.add_argument("username", type=str, required=True,
-                             help="No username provided", location='json')
-        self.reqparse.add_argument("password", type=str, required=True,
-                             help="No password given", location='json')
-        self.reqparse.add_argument("role", type=str, required=True,
-                             help="No role given", location='json')
-        super(UsersAPI, self).__init__()
+    # Request body of post, validated by validators.use_args
+    post_args = validators.RequestSchema(
+        validators.Arg("username", required=True, help="No username provided"),
+        validators.Arg("password", required=True, help="No password given"),
+        validators.Arg("role", required=True, help="No role given"))
 
     # POST /users
-    def post(self):
+    @validators.use_args(post_args)
+    def post(self, data):
         """Login already existing user or add new user"""
-        logs.debug_ ("_________________________________________________")
-        logs.debug_ ("UserAPI post fn: %s\nJson Request\n=============\n %s" %(request, request.json))
-
-        # Get values from request
-        args = self.reqparse.parse_args()
-        for key, value in args.iteritems():
-            if value is not None:
-                if (key == 'username'):
-                    username = request.json['username']
-                if (key == 'password'):
-                    password = request.json['password']
-                if (key == 'role'):
-                    role = request.json['role']
+        if logs.debug_enabled():
+            logs.debug_ ("_________________________________________________")
+            logs.debug_ ("UserAPI post fn: %s\nJson Request\n=============\n %s", request, request.json)
+
+        username = data['username']
+        password = data['password']
+        role = data['role']
 
         if ((role != 'admin') and  (role != 'user')):
             response = handle_invalid_usage(InvalidUsageException
@@ -712,15 +681,13 @@ class UsersAPI(Resource):
 
         # Check and Update tables
         # This is implemented as if we are processing get /users
-        user_obj = models.User.query.filter_by(username=username).all()
-        user_index = None
-        for i in range(len(user_obj)):
-            if username in user_obj[i].username:
-                user_index = i
-        if user_index is not None:
+        user_obj = models.user_by_name(username).first()
+        if user_obj is not None:
             #match encrypted password with one in table 
-            if not bcrypt.check_password_hash(user_obj[user_index].password, 
-                    password):
+            with metrics.timed(metrics.BCRYPT_SECONDS, 'check'):
+                password_ok = bcrypt.check_password_hash(user_obj.password,
+                                                         password)
+            if not password_ok:
                 response = handle_invalid_usage(InvalidUsageException
                            ('Error: Password for user does not match', 
                             status_code=401))
@@ -728,11 +695,20 @@ class UsersAPI(Resource):
 
         else:
             # Add new user
-            user_obj = models.User(username, 
-                                 bcrypt.generate_password_hash(password), 
-                                 role)
+            with metrics.timed(metrics.BCRYPT_SECONDS, 'hash'):
+                password_hash = bcrypt.generate_password_hash(password)
+            user_obj = models.User(username, password_hash, role)
             models.db.session.add(user_obj)
-            models.db.session.commit()
+            try:
+                models.db.session.commit()
+            except IntegrityError:
+                # username is unique, lost a race with another request
+                models.db.session.rollback()
+                response = handle_invalid_usage(InvalidUsageException
+                           ('Error: Username already exists', 
+                            status_code=409))
+                return response
+            basicauth.invalidate_user(username)
 
         # Create flask session here with secret key based on username
 #        if 'username' not in session:
@@ -741,13 +717,17 @@ class UsersAPI(Resource):
         # Return response
         location = "/users/%s" % user_obj.userid
         query_obj = models.User.query.filter_by(userid=user_obj.userid).all()
-        resource_fields = {'userid':fields.Integer}
-        user = marshal(query_obj, resource_fields)
-        response = jsonify(user=user)
+        user = serializers.USER.dump_many(query_obj)
+
+        # Signed token the client can send as 'Authorization: Bearer token'
+        # instead of Basic credentials. Role comes from the users table
+        token = tokens.generate_token(user_obj.userid, user_obj.username,
+                                      user_obj.role)
+        response = serializers.json_response(user=user, token=token,
+                                             expires_in=tokens.TOKEN_MAX_AGE)
         response.status_code = 201
         response.location = location
         logs.info_(response)
-        utls.display_tables()
         return response
 
 class UsrQuizzesAPI(Resource):
@@ -755,18 +735,14 @@ class UsrQuizzesAPI(Resource):
         for /api/quizzes endpoint 
     """
 
-    def __init__(self):
-        """ Uses RequestParser class of Flask restful to parse/validate
-            flask.request 
-        """
-    # GET /user/quizzes
+    # GET /user/quizzes?after=0&limit=100&fields=qzid,title
     @basicauth.login_required
     def get(self):
-        """Get all quizzes"""
+        """Get a page of quizzes"""
         logs.debug_ ("_______________________________________________")
-        logs.debug_ ("QuizzesAPI get fn: %s" %(request))
+        logs.debug_ ("QuizzesAPI get fn: %s", request)
 
-        userid, username = utls.get_user_from_hdr()
+        userid, username = utls.get_cur_user()
         if 'username' not in session:
             response = handle_invalid_usage(InvalidUsageException
                         ('Error: No active session for this user found', 
@@ -774,22 +750,40 @@ class UsrQuizzesAPI(Resource):
             
             return response
 
-        # Query from quiz table
-        query_obj = models.Quiz.query.order_by(models.Quiz.qzid).all()
-        if not query_obj:
-            response = handle_invalid_usage(InvalidUsageException
-                        ('Error: No quizzes found', status_code=404))
-            return response
+        try:
+            page = utls.page_args(serializers.QUIZ, 'qzid',
+                                  serializers.QUIZ_SUMMARY.names)
+        except ValueError as e:
+            return handle_invalid_usage(InvalidUsageException(e.args[0],
+                                                          status_code=400))
+
+        # Conditional GET, nothing is queried/serialized if client is current
+        etag = utls.page_etag(utls.quiz_list_etag(), page)
+        if utls.etag_matches(etag):
+            return serializers.not_modified(etag)
+
+        # Serialized page is cached until an admin changes quizzes
+        key = ('quizzes', etag)
+        body = cache.responses.get(key)
+        if body is None:
+            # Query from quiz table
+            query_obj = models.keyset_page(models.Quiz.query,
+                            models.Quiz.qzid, page.after, page.limit,
+                            utls.columns_of(models.Quiz, page.fields)).all()
+            if not query_obj and not page.after:
+                response = handle_invalid_usage(InvalidUsageException
+                            ('Error: No quizzes found', status_code=404))
+                return response
+            user = serializers.QUIZ.only(*page.fields).dump_many(query_obj)
+            body = serializers.dumps(dict(user=user,
+                            next=utls.next_cursor(query_obj, page, 'qzid')))
+            cache.responses.set(key, body)
 
         # Return response
-        resource_fields =  {'qzid':fields.Integer,
-                            'title':fields.String
-                            }
-        user = marshal(query_obj, resource_fields)
-        response = jsonify(user=user)
+        response = serializers.body_response(body)
+        response.set_etag(etag)
         response.status_code = 200
         logs.info_(response)
-        utls.display_tables()
         return response
 
 class UsrQuizAPI(Resource):
@@ -797,42 +791,42 @@ class UsrQuizAPI(Resource):
         for /api/quizzes/<qzid> endpoint 
     """
 
-    def __init__(self):
-        """ Uses RequestParser class of Flask restful to parse/validate
-            flask.request 
-        """
-
     # GET  /user/quizzes/{qzid}
     @basicauth.login_required
     def get(self, qzid):
         """Get quiz details"""
         logs.debug_ ("_________________________________________________")
-        logs.debug_ ("QuizAPI get fn: %s" %(request))
+        logs.debug_ ("QuizAPI get fn: %s", request)
 
-        userid, username = utls.get_user_from_hdr()
+        userid, username = utls.get_cur_user()
         if 'username' not in session:
             response = handle_invalid_usage(InvalidUsageException
                         ('Error: No active session for this user found', 
                          status_code=404))
             return response
 
-        # Query from quiz table
-        query_obj = models.Quiz.query.filter_by(qzid=qzid).all()
-        if not query_obj:
-            response = handle_invalid_usage(InvalidUsageException
-                         ('Error: Quiz not found', status_code=404))
-            return response
+        # Conditional GET, nothing is queried/serialized if client is current
+        etag = utls.quiz_etag(qzid)
+        if utls.etag_matches(etag):
+            return serializers.not_modified(etag)
+
+        # Serialized response is cached until an admin changes the quiz
+        key = ('quiz', qzid, etag)
+        body = cache.responses.get(key)
+        if body is None:
+            # Query from quiz table
+            query_obj = models.Quiz.query.filter_by(qzid=qzid).all()
+            if not query_obj:
+                response = handle_invalid_usage(InvalidUsageException
+                             ('Error: Quiz not found', status_code=404))
+                return response
+            quiz = serializers.QUIZ.dump_many(query_obj)
+            body = serializers.dumps(dict(quiz=quiz))
+            cache.responses.set(key, body)
 
         # Return response
-        resource_fields =  {'qzid':fields.Integer,
-                            'title':fields.String,
-                            'difficulty_level':fields.String,
-                            'text':fields.String,
-                            'no_ques':fields.Integer
-                            }
-        quiz = marshal(query_obj, resource_fields)
-        response = jsonify(quiz=quiz)
-        utls.display_tables()
+        response = serializers.body_response(body)
+        response.set_etag(etag)
         response.status_code = 200
         logs.info_(response)
         return response
@@ -844,26 +838,29 @@ class UsrQuizRtAPI(Resource):
     def get(self, qzid):
         """Get result for taker of this  quiz"""
         logs.debug_ ("_________________________________________________")
-        logs.debug_ ("UsrQuizRtAPI get fn: %s" %(request))
+        logs.debug_ ("UsrQuizRtAPI get fn: %s", request)
 
-        userid, username = utls.get_user_from_hdr()
+        userid, username = utls.get_cur_user()
         if 'username' not in session:
             response = handle_invalid_usage(InvalidUsageException
                         ('Error: No active session for this user found', 
                          status_code=404))
             return response
 
-        # Find quiz result for session
-        query_obj = models.User.query.filter_by(userid=userid).first()
-        result = query_obj.qzscore
+        # Find latest attempt of user at this quiz
+        attempt = models.latest_attempt(userid, qzid)
+        if attempt is None:
+            result = dict(result=0, attempt=0, answered=0, total=0)
+        else:
+            result = dict(result=attempt.score, attempt=attempt.attempt,
+                          answered=attempt.answered, total=attempt.total)
 
         # Return response
         logs.debug_ ("Json response")
         logs.debug_ ("=============\n")
-        logs.debug_ ("{\'result\':%s}\n" %(result))
-        response = jsonify (result=result)
+        logs.debug_ ("%s\n", result)
+        response = serializers.json_response(qzid=qzid, **result)
         response.status_code = 200
-        utls.display_tables()
         logs.info_(response)
         return response
 
@@ -872,62 +869,64 @@ class UsrQuestionAPI(Resource):
         for /api/quizzes/<qzid>/questions/<qid> endpoint 
     """
 
-    def __init__(self):
-        """ Uses RequestParser class of Flask restful to parse/validate
-            flask.request 
-        """
-        self.reqparse = reqparse.RequestParser()
-        self.reqparse.add_argument('anschoices', type=str, required=True,
-                             help='No ans choice provided', location='json')
-        super(UsrQuestionAPI, self).__init__()
+    # Request body of post, validated by validators.use_args
+    post_args = validators.RequestSchema(
+        validators.Arg('anschoices', type=validators.List("correct"),
+                       required=True, help='No ans choice provided'))
 
     # GET  /user/quizzes/{qzid}/questions/{qid}
     @basicauth.login_required
     def get(self, qzid, qid):
         """Get question qid for quiz"""
         logs.debug_ ("_________________________________________________")
-        logs.debug_ ("QuestionAPI get fn: %s" %(request))
+        logs.debug_ ("QuestionAPI get fn: %s", request)
 
-        userid, username = utls.get_user_from_hdr()
+        userid, username = utls.get_cur_user()
         if 'username' not in session:
             response = handle_invalid_usage(InvalidUsageException(
                          'Error: No active session for this user found', 
                           status_code=404))
             return response
 
-        # Query Question table
-        query_obj = models.Question.query.join(models.Anschoice).filter\
-                         (models.Question.qid == qid,models.Question.qzid == qzid).all()
-        if not query_obj:
-            response = handle_invalid_usage(InvalidUsageException
-                         ('Error: Question not found', status_code=404))
-            return response
+        # Conditional GET, nothing is queried/serialized if client is current
+        etag = utls.question_etag(qzid, qid)
+        if utls.etag_matches(etag):
+            return serializers.not_modified(etag)
+
+        # Serialized response is cached until an admin changes the ques
+        key = ('question', qzid, qid, etag)
+        body = cache.responses.get(key)
+        if body is None:
+            # Query Question table
+            query_obj = models.questions_with_choices(qid=qid,
+                                                      qzid=qzid).all()
+            if not query_obj:
+                response = handle_invalid_usage(InvalidUsageException
+                             ('Error: Question not found', status_code=404))
+                return response
+            question = serializers.QUESTION_TAKER.dump_many(query_obj)
+            body = serializers.dumps(dict(question=question))
+            cache.responses.set(key, body)
 
         # Return response
-        ans_fields = {'ans_choice':fields.String,
-                      'correct':fields.Boolean
-                     }
-        resource_fields =  {'qid':fields.Integer,
-                            'ques_text':fields.String,
-                            'anschoices':fields.Nested(ans_fields)
-                           }
-        question = marshal(query_obj, resource_fields)
-        response = jsonify(question=question)
+        response = serializers.body_response(body)
+        response.set_etag(etag)
         response.status_code = 200
         logs.info_(response)
-        utls.display_tables()
         return response
 
+    # POST  /user/quizzes/{qzid}/questions/{qid}
     @basicauth.login_required
-    # POST  /user/quizzes/{qzid}/questions
-    def post(self, qzid, qid):
+    @validators.use_args(post_args)
+    def post(self, qzid, qid, data):
         """Answer question of quiz"""
-        logs.debug_ ("_________________________________________________")
-        logs.debug_ ("QuestionAPI patch fn: %s \nJson Request\n=============\n %s" 
-                    %(request, request.json))
+        if logs.debug_enabled():
+            logs.debug_ ("_________________________________________________")
+            logs.debug_ ("QuestionAPI patch fn: %s \nJson Request\n=============\n %s", 
+                        request, request.json)
 
         # Check if cookie user_session exists
-        userid, username = utls.get_user_from_hdr()
+        userid, username = utls.get_cur_user()
         if 'username' not in session:
             response = handle_invalid_usage(InvalidUsageException(
                             'Error: No active session found for this user', 
@@ -943,50 +942,155 @@ class UsrQuestionAPI(Resource):
                             status_code=400))
             return response
 
-        args = self.reqparse.parse_args()
-        for key, value in args.iteritems():
-            if value is not None:
-                if (key == 'anschoices'):
-                    anschoices = request.json['anschoices']
+        # Comparing quiz taker answers with the question's answer key
+        qn_obj = query_obj[0]
+        correct = grading.grade((qn_obj.answer_mask, qn_obj.no_choices),
+                                data['anschoices'])
 
-        # Comparing quiz taker answers with actual ans choices in db
-        correct = True
-        query_obj = models.Anschoice.query.filter_by(qid=qid).all()
+        # Record outcome in the user's attempt, scores are updated with
+        # atomic increments
+        try:
+            grading.record_answer(userid, qzid, qid, correct)
+            change = leaderboard.update_best(userid, qzid)
+            models.db.session.commit()
+        except IntegrityError:
+            models.db.session.rollback()
+            response = handle_invalid_usage(InvalidUsageException
+                           ('Error: Question is being answered by another '
+                            'request, retry', status_code=409))
+            return response
+        leaderboard.apply(change)
 
-        index = 0
-        for choice in query_obj:
-            if (unicode(query_obj[index].correct) != 
-                                  anschoices[index]["correct"]):
-                correct = False
-            index += 1
-        if correct:
-            #update the user table in the database
-            query_obj = models.User.query.filter_by(userid=userid).all()
-            cur_qzscore= query_obj[0].qzscore  #get current quiz score
-            #increment quiz score
-            models.User.query.filter_by(userid=userid).\
-                                  update(dict(qzscore=cur_qzscore+1))
-
-        query_obj = models.Question.query.join(models.Anschoice).filter\
-                          (models.Question.qid == qid).all()
+        query_obj = models.questions_with_choices(qid=qid).all()
         location = "/quizzes/<int:qzid>/result %s" % qzid
 
         # Return response
-        ans_fields = {'ans_choice':fields.String,
-                      'correct':fields.Boolean
-                     }
-        resource_fields =  {'qid':fields.Integer,
-                            'ques_text':fields.String,
-                            'ans_text':fields.String,
-                            'qzid':fields.Integer,
-                            'anschoices':fields.Nested(ans_fields)
-                           }
-        question = marshal(query_obj, resource_fields)
-        response = jsonify(question=question)
+        question = serializers.QUESTION.dump_many(query_obj)
+        response = serializers.json_response(question=question)
+        response.status_code = 200
+        response.location = location
+        logs.info_(response)
+        return response
+
+class UsrAnswersAPI(Resource):
+    """ Class that defines methods for processing post requests 
+        for /user/quizzes/<qzid>/answers endpoint. Grades the answers to
+        all questions of a quiz attempt in one request and transaction.
+    """
+
+    # Request body of post, validated by validators.use_args
+    post_args = validators.RequestSchema(
+        validators.Arg('answers', type=validators.List("qid", "anschoices"),
+                       required=True, help='No answers provided'))
+    anschoices_type = staticmethod(validators.List("correct"))
+
+    # POST  /user/quizzes/{qzid}/answers
+    @basicauth.login_required
+    @validators.use_args(post_args)
+    def post(self, qzid, data):
+        """Answer all questions of quiz"""
+        if logs.debug_enabled():
+            logs.debug_ ("_________________________________________________")
+            logs.debug_ ("UsrAnswersAPI post fn: %s \nJson Request\n=============\n %s", 
+                        request, request.json)
+
+        userid, username = utls.get_cur_user()
+        if 'username' not in session:
+            response = handle_invalid_usage(InvalidUsageException(
+                            'Error: No active session found for this user', 
+                             status_code=404))
+            return response
+
+        # Answer keys of all questions of the quiz in one query
+        key = grading.answer_key(qzid)
+        if not key:
+            response = handle_invalid_usage(InvalidUsageException
+                           ('Error: No question for quiz found', 
+                            status_code=404))
+            return response
+
+        # Grade all answers in memory
+        results = []
+        seen = set()
+        for answer in data['answers']:
+            qid = answer['qid']
+            if qid not in key or qid in seen:
+                response = handle_invalid_usage(InvalidUsageException
+                           ('Error: Question %s not found for quiz or '
+                            'answered twice' % qid, status_code=400))
+                return response
+            try:
+                anschoices = self.anschoices_type(answer['anschoices'])
+            except ValueError as e:
+                response = handle_invalid_usage(InvalidUsageException
+                           ('Error: anschoices of question %s %s' % (qid, e), 
+                            status_code=400))
+                return response
+            results.append(dict(qid=qid,
+                                correct=grading.grade(key[qid], anschoices)))
+            seen.add(qid)
+        # Record the attempt in a single transaction
+        try:
+            attempt = grading.record_attempt(userid, qzid, results, len(key))
+            change = leaderboard.update_best(userid, qzid)
+            models.db.session.commit()
+        except IntegrityError:
+            models.db.session.rollback()
+            response = handle_invalid_usage(InvalidUsageException
+                           ('Error: Attempt could not be recorded, retry', 
+                            status_code=409))
+            return response
+        leaderboard.apply(change)
+
+        # Return response
+        location = "/user/quizzes/%s/result" % qzid
+        response = serializers.json_response(qzid=qzid, score=attempt.score,
+                                             attempt=attempt.attempt,
+                                             total=len(key), results=results)
         response.status_code = 200
         response.location = location
         logs.info_(response)
-        utls.display_tables()
+        return response
+
+class UsrLeaderboardAPI(Resource):
+    """ Class that defines methods for processing get requests 
+        for /user/quizzes/<qzid>/leaderboard endpoint. Top takers of a
+        quiz by best attempt score, and the rank of the current user.
+    """
+
+    MAX_LIMIT = 100
+
+    # GET /user/quizzes/{qzid}/leaderboard?limit=10
+    @basicauth.login_required
+    def get(self, qzid):
+        """Get leaderboard of quiz"""
+        logs.debug_ ("_________________________________________________")
+        logs.debug_ ("UsrLeaderboardAPI get fn: %s", request)
+
+        userid, username = utls.get_cur_user()
+        if 'username' not in session:
+            response = handle_invalid_usage(InvalidUsageException
+                        ('Error: No active session for this user found', 
+                         status_code=404))
+            return response
+
+        limit = request.args.get('limit', leaderboard.TOP_LIMIT, type=int)
+        if limit < 1 or limit > self.MAX_LIMIT:
+            response = handle_invalid_usage(InvalidUsageException
+                        ('Error: limit should be between 1 and %i'
+                         % self.MAX_LIMIT, status_code=400))
+            return response
+
+        if models.quiz_version(qzid) is None:
+            response = handle_invalid_usage(InvalidUsageException
+                        ('Error: Quiz not found', status_code=404))
+            return response
+
+        # Return response
+        response = serializers.json_response(
+                        **leaderboard.leaderboard(qzid, userid, limit))
+        response.status_code = 200
+        logs.info_(response)
         return response
 
 class SessionAPI(Resource):
@@ -999,39 +1103,155 @@ class SessionAPI(Resource):
     def delete(self):
         """Delete session"""
         logs.debug_ ("_________________________________________________")
-        logs.debug_ ("SessionAPI del fn: %s" %(request.url))
+        logs.debug_ ("SessionAPI del fn: %s", request.url)
 
         # Pop user from session
-        userid, username = utls.get_user_from_hdr()
+        userid, username = utls.get_cur_user()
         if 'username' not in session:
             logs.debug_("User already not in session")
         else:
             session.pop('username', None)
 
         # Return response
-        utls.display_tables()
         return 204
 
+class AdmnExportAPI(Resource):
+    """ Class that defines methods for processing get requests 
+        for /admin/export/<kind> endpoint. Streams the quizzes, questions
+        or results of the admin's quizzes, see exporter.py
+    """
+
+    # GET  /admin/export/{kind}?format=ndjson&after=0&qzid=
+    # GET  /admin/export/questions?format=csv&after=0&after_ansid=&qzid=
+    @basicauth.login_required
+    @role.admin_required
+    def get(self, kind):
+        """Export quizzes/questions/results"""
+        logs.debug_ ("_________________________________________________")
+        logs.debug_ ("AdmnExportAPI get fn: %s", request)
+
+        userid, username = utls.get_cur_user()
+        if 'username' not in session:
+            response = handle_invalid_usage(InvalidUsageException
+                        ('Error: No active session for this user found', 
+                         status_code=404))
+            return response
+
+        if kind not in exporter.EXPORTS:
+            response = handle_invalid_usage(InvalidUsageException
+                        ('Error: Export not found', status_code=404))
+            return response
+
+        fmt = request.args.get('format', 'ndjson')
+        after = request.args.get('after', 0, type=int)
+        qzid = request.args.get('qzid', None, type=int)
+        after_ansid = request.args.get('after_ansid', None, type=int)
+        if fmt not in exporter.FORMATS:
+            response = handle_invalid_usage(InvalidUsageException
+                        ('Error: format should be one of %s'
+                         % ', '.join(sorted(exporter.FORMATS)),
+                         status_code=400))
+            return response
+        if after_ansid is not None and (kind, fmt) != ('questions', 'csv'):
+            response = handle_invalid_usage(InvalidUsageException
+                        ('Error: after_ansid is only taken by the '
+                         'questions csv export', status_code=400))
+            return response
+
+        # Return response, rows are read while the body is sent
+        response = serializers.stream_response(
+                        exporter.export(kind, fmt, userid, after, qzid,
+                                        after_ansid),
+                        exporter.FORMATS[fmt], '%s.%s' % (kind, fmt))
+        response.status_code = 200
+        logs.info_(response)
+        return response
+
+class AdmnTablesAPI(Resource):
+    """ Class that defines methods for processing get requests 
+        for /admin/tables/<table> endpoint. Returns one page of a db table
+        for diagnostics, on demand instead of after every request.
+    """
+
+    MAX_PER_PAGE = 500
+
+    # GET  /admin/tables/{table}?page=1&per_page=50
+    @basicauth.login_required
+    @role.admin_required
+    def get(self, table):
+        """Get one page of table entries"""
+        logs.debug_ ("_________________________________________________")
+        logs.debug_ ("AdmnTablesAPI get fn: %s", request)
+
+        if 'username' not in session:
+            response = handle_invalid_usage(InvalidUsageException
+                        ('Error: No active session for this user found', 
+                         status_code=404))
+            return response
+
+        page = request.args.get('page', 1, type=int)
+        per_page = request.args.get('per_page', 50, type=int)
+        if page < 1 or per_page < 1 or per_page > self.MAX_PER_PAGE:
+            response = handle_invalid_usage(InvalidUsageException
+                        ('Error: page should be >= 1 and per_page between '
+                         '1 and %i' % self.MAX_PER_PAGE, status_code=400))
+            return response
+
+        result = utls.table_page(table, page, per_page)
+        if result is None:
+            response = handle_invalid_usage(InvalidUsageException
+                        ('Error: Table not found', status_code=404))
+            return response
+
+        # Return response
+        columns, page_obj = result
+        rows = serializers.raw_schema(columns).dump_many(page_obj.items)
+        response = serializers.json_response(table=table,
+                                             page=page_obj.page,
+                                             per_page=per_page,
+                                             pages=page_obj.pages,
+                                             total=page_obj.total, rows=rows)
+        response.status_code = 200
+        logs.info_(response)
+        return response
+
 api.add_resource(AdmnQuizzesAPI, '/admin/quizzes')
 api.add_resource(AdmnQuizAPI, '/admin/quizzes/<int:qzid>')
 api.add_resource(AdmnQuestionsAPI, '/admin/quizzes/<int:qzid>/questions')
+api.add_resource(AdmnQuestionsImportAPI, '/admin/quizzes/<int:qzid>/questions/import')
 api.add_resource(AdmnQuestionAPI, '/admin/quizzes/<int:qzid>/questions/<int:qid>')
+api.add_resource(AdmnTablesAPI, '/admin/tables/<string:table>')
+api.add_resource(AdmnExportAPI, '/admin/export/<string:kind>')
 
 api.add_resource(UsrQuizzesAPI, '/user/quizzes')
 api.add_resource(UsrQuizAPI, '/user/quizzes/<int:qzid>')
 api.add_resource(UsrQuizRtAPI, '/user/quizzes/<int:qzid>/result')
 api.add_resource(UsrQuestionAPI, '/user/quizzes/<int:qzid>/questions/<int:qid>')
+api.add_resource(UsrAnswersAPI, '/user/quizzes/<int:qzid>/answers')
+api.add_resource(UsrLeaderboardAPI, '/user/quizzes/<int:qzid>/leaderboard')
 
 api.add_resource(UsersAPI, '/users')
 api.add_resource(SessionAPI, '/session')
 
-if __name__ == '__main__':
-
-    #Initial config for db, this can be disabled
-    models.db_init()
-
-    utls.display_tables()
-    app.debug = True
-
-    app.run('192.168.33.10', 5001)
+def create_app(settings=None):
+    """ Returns a new qzngn app with db, bcrypt, api and (if enabled)
+        metrics set up.
+        settings override the flask config from config.py.
+    """
+    app = Flask(__name__)
+    app.secret_key = config.SECRET_KEY
+    config.engine_config(app)
+    app.config.update(settings or {})
+
+    models.db.init_app(app)
+    models.bcrypt.init_app(app)
+    api.init_app(app)
+    app.register_error_handler(InvalidUsageException, handle_invalid_usage)
+    if config.METRICS:
+        metrics.init_app(app)
+    return app
 
+if __name__ == '__main__':
+    # Dev server, wsgi.py is the entry point for WSGI servers
+    import wsgi
+    wsgi.run_dev()
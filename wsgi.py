@@ -0,0 +1,41 @@
+###########################################################################
+#
+#   File Name      Date        Owner           Description
+#   ---------    -------     ---------        ------------
+#   wsgi.py      7/8/2018     pyflask  WSGI entry point for qzengine
+#                                            restful APIs
+#
+#  gunicorn -c gunicorn_conf.py wsgi:app
+#  The db is initialised once on import (QZNGN_DB_INIT=0 skips it) and
+#  the pooled connections are closed again, so worker processes forked
+#  from here open their own. python wsgi.py runs the dev server on
+#  QZNGN_BIND.
+#
+###########################################################################
+
+import os
+import config
+import models
+import utls
+import views
+
+DB_INIT = os.environ.get('QZNGN_DB_INIT', '1') != '0'
+
+app = views.create_app()
+
+if DB_INIT:
+    with app.app_context():
+        models.db_init()
+        models.check_query_plans()
+    models.dispose_engines(app)
+
+def run_dev():
+    """Flask dev server on config.BIND"""
+    with app.app_context():
+        utls.display_tables()
+    host, port = config.BIND.rsplit(':', 1)
+    app.debug = True
+    app.run(host, int(port))
+
+if __name__ == '__main__':
+    run_dev()